@@ -0,0 +1,99 @@
+"""character_tables.py
+
+    Values of the quadratic characters chi_D of the fields Q(sqrt(d)), as
+    NumPy arrays, for many arguments or many d at once. We use that chi_D is
+    the product of the characters of the prime discriminants dividing D,
+    each of which is a lookup in a small table.
+
+    ====================================================================
+
+    This file is part of Quadratic Kenku Solver.
+
+    Copyright (C) 2022 Barinder S. Banwait, Filip Najman, and Oana
+    Padurariu
+
+    Quadratic Kenku Solver is free software: you can redistribute it
+    and/or modify it under the terms of the GNU General Public License
+    as published by the Free Software Foundation, either version 3 of
+    the License, or any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+    ====================================================================
+
+"""
+
+from functools import lru_cache
+
+import numpy as np
+
+from sieves import prime_divisors
+
+
+@lru_cache(maxsize=None)
+def legendre_table(q):
+    """int8 array whose r-th entry is the Legendre symbol (r / q), for an
+    odd prime q"""
+
+    table = -np.ones(q, dtype=np.int8)
+    table[(np.arange(1, q, dtype=np.int64) ** 2) % q] = 1
+    table[0] = 0
+    return table
+
+
+def _kronecker_at_two_part(e, n):
+    """chi_e(n) for the prime discriminants e = -4, 8, -8, on an array n"""
+
+    r = n % 8
+    if e == -4:
+        values = np.where(r % 4 == 1, 1, -1)
+    elif e == 8:
+        values = np.where((r == 1) | (r == 7), 1, -1)
+    else:
+        values = np.where((r == 1) | (r == 3), 1, -1)
+    return np.where(n % 2 == 0, 0, values).astype(np.int8)
+
+
+def kronecker_values(d, n):
+    """The values chi_D(n) on an int64 array n, where D is the discriminant
+    of Q(sqrt(d)) for squarefree d"""
+
+    d = int(d)
+    D = d if d % 4 == 1 else 4 * d
+    chi = np.ones(len(n), dtype=np.int8)
+    odd_part = 1
+
+    for q in prime_divisors(d):
+        if q == 2:
+            continue
+        chi *= legendre_table(q)[n % q]
+        odd_part *= q if q % 4 == 1 else -q
+
+    if D != odd_part:
+        chi *= _kronecker_at_two_part(D // odd_part, n)
+
+    return chi
+
+
+def kronecker_table(d_vals, primes):
+    """int8 array of shape (len(d_vals), len(primes)) whose (i, j) entry is
+    chi_D(q) for d = d_vals[i] and q = primes[j], for odd primes q. Each
+    column is a single lookup in the Legendre table of q."""
+
+    d_arr = np.array([int(d) for d in d_vals], dtype=np.int64)
+    table = np.empty((len(d_arr), len(primes)), dtype=np.int8)
+
+    for j, q in enumerate(primes):
+        q = int(q)
+        if q == 2:
+            raise ValueError("kronecker_table is only for odd primes")
+        # chi_D(q) = (D / q) = (d / q) for odd q, as 4 is a square
+        table[:, j] = legendre_table(q)[d_arr % q]
+
+    return table
@@ -0,0 +1,225 @@
+"""deadline_executor.py
+
+    Runs jobs, i.e. functions with their arguments, each in its own child
+    process with a wall-clock deadline and a memory limit, and reports how
+    each one ended: ok, timeout, oom or error.
+
+    This replaces the SIGALRM based `timeout` decorator, which only works
+    in the main thread, cannot be nested, and cannot interrupt PARI while
+    it is inside C code. A child process can always be killed, so nothing
+    here depends on signals reaching the job, and the functions below may
+    be called from threads, or from asyncio via `asyncio.to_thread`. They
+    may be called from other processes too, but not from daemonic ones,
+    which cannot have children: in particular not from the workers of a
+    `multiprocessing.Pool`. Use `concurrent.futures.ProcessPoolExecutor`,
+    whose workers are not daemonic, to spread such callers over processes.
+
+    The memory limit is put on the address space of the child on top of
+    what it inherits from the parent. When PARI runs out of stack, the job
+    is retried with the next of a list of larger stack sizes before it is
+    given up as oom.
+
+    ====================================================================
+
+    This file is part of Quadratic Kenku Solver.
+
+    Copyright (C) 2022 Barinder S. Banwait, Filip Najman, and Oana
+    Padurariu
+
+    Quadratic Kenku Solver is free software: you can redistribute it
+    and/or modify it under the terms of the GNU General Public License
+    as published by the Free Software Foundation, either version 3 of
+    the License, or any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+    ====================================================================
+
+"""
+
+import logging
+import resource
+import signal
+import time
+from multiprocessing import current_process, get_context
+from multiprocessing.connection import wait
+
+from sage.all import pari
+
+logger = logging.getLogger(__name__)
+
+OK = "ok"
+TIMEOUT = "timeout"
+OOM = "oom"
+ERROR = "error"
+
+DEADLINE_S = 30
+# On top of the address space the child inherits
+MEMORY_LIMIT_BYTES = 8 * 2**30
+# PARI stack sizes for the first attempt and the retries
+PARI_STACK_SIZES = (256000000, 1024000000, 4096000000)
+
+# Jobs are usually closures over Sage objects, so the children are forked
+_CONTEXT = get_context("fork")
+
+
+class Outcome:
+    """How a job ended: its status, its return value if the status is OK
+    and a message otherwise, the number of attempts and the seconds spent
+    over all of them"""
+
+    def __init__(self, status, value, attempts, seconds):
+        self.status = status
+        self.value = value
+        self.attempts = attempts
+        self.seconds = seconds
+
+    def __repr__(self):
+        return (
+            f"Outcome({self.status!r}, {self.value!r}, attempts={self.attempts}, "
+            f"seconds={self.seconds:.3f})"
+        )
+
+
+def _address_space_size():
+    with open("/proc/self/statm", "r") as statm_file:
+        return int(statm_file.read().split()[0]) * resource.getpagesize()
+
+
+def _is_out_of_memory(err):
+    return isinstance(err, MemoryError) or "stack overflows" in str(err)
+
+
+def _child_main(conn, func, args, memory_limit, pari_stack_size):
+
+    if memory_limit is not None:
+        limit = _address_space_size() + memory_limit
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    if pari_stack_size is not None:
+        pari.allocatemem(pari_stack_size, silent=True)
+
+    try:
+        conn.send((OK, func(*args)))
+    except Exception as err_msg:
+        status = OOM if _is_out_of_memory(err_msg) else ERROR
+        conn.send((status, f"{type(err_msg).__name__}: {err_msg}"))
+    conn.close()
+
+
+def _status_of_death(exitcode):
+    """The outcome of a child which died without answering. The kernel's
+    OOM killer uses SIGKILL."""
+
+    if exitcode == -signal.SIGKILL:
+        return OOM, "killed, presumably for lack of memory"
+    return ERROR, f"died with exit code {exitcode}"
+
+
+def run_jobs(
+    jobs,
+    num_workers=1,
+    deadline=DEADLINE_S,
+    memory_limit=MEMORY_LIMIT_BYTES,
+    pari_stack_sizes=PARI_STACK_SIZES,
+):
+    """Runs each (key, func, args) of `jobs`, at most `num_workers` at a
+    time, and yields (key, Outcome) as they finish. An oom job is retried
+    with the next PARI stack size, if any is left. `memory_limit` (bytes)
+    and `pari_stack_sizes` may be None for no limit and PARI's defaults.
+    Must not be called from a daemonic process; see the top of this file."""
+
+    if num_workers < 1:
+        raise ValueError(f"num_workers should be at least 1, not {num_workers}")
+    if current_process().daemon:
+        raise RuntimeError(
+            "run_jobs cannot start children from a daemonic process, such as "
+            "a multiprocessing.Pool worker; use a ProcessPoolExecutor instead"
+        )
+
+    stack_sizes = list(pari_stack_sizes) if pari_stack_sizes else [None]
+    pending = [
+        {"key": key, "func": func, "args": args, "attempt": 0, "seconds": 0.0}
+        for key, func, args in jobs
+    ][::-1]
+    running = {}
+
+    def start_job(job):
+        recv_conn, send_conn = _CONTEXT.Pipe(duplex=False)
+        process = _CONTEXT.Process(
+            target=_child_main,
+            args=(
+                send_conn,
+                job["func"],
+                job["args"],
+                memory_limit,
+                stack_sizes[job["attempt"]],
+            ),
+        )
+        process.start()
+        send_conn.close()
+        running[recv_conn] = (process, job, time.monotonic())
+
+    try:
+        while pending or running:
+            while pending and len(running) < num_workers:
+                start_job(pending.pop())
+
+            first_deadline = min(start for _, _, start in running.values()) + deadline
+            ready = wait(list(running), timeout=max(0, first_deadline - time.monotonic()))
+
+            # (job, status, value) for the jobs which ended in this round
+            ended = []
+            for conn in ready:
+                process, job, start = running.pop(conn)
+                try:
+                    status, value = conn.recv()
+                except EOFError:
+                    process.join()
+                    status, value = _status_of_death(process.exitcode)
+                conn.close()
+                process.join()
+                job["seconds"] += time.monotonic() - start
+                ended.append((job, status, value))
+
+            now = time.monotonic()
+            for conn, (process, job, start) in list(running.items()):
+                if now - start > deadline:
+                    process.kill()
+                    process.join()
+                    conn.close()
+                    del running[conn]
+                    job["seconds"] += now - start
+                    ended.append((job, TIMEOUT, f"no answer after {deadline}s"))
+
+            for job, status, value in ended:
+                if status == OOM and job["attempt"] + 1 < len(stack_sizes):
+                    job["attempt"] += 1
+                    logger.info(
+                        f"Retrying {job['key']} with a PARI stack of "
+                        f"{stack_sizes[job['attempt']]} bytes"
+                    )
+                    pending.append(job)
+                else:
+                    outcome = Outcome(status, value, job["attempt"] + 1, job["seconds"])
+                    yield job["key"], outcome
+
+    finally:
+        # if the caller stops early, leave no children behind
+        for conn, (process, _, _) in running.items():
+            process.kill()
+            process.join()
+            conn.close()
+
+
+def run_with_deadline(func, *args, **kwargs):
+    """The Outcome of func(*args) in a child process; the keyword arguments
+    are those of `run_jobs`"""
+
+    for _, outcome in run_jobs([(None, func, args)], **kwargs):
+        return outcome
@@ -0,0 +1,197 @@
+"""disc_index.py
+
+    An index, for all squarefree d in a range, of the discriminant of
+    Q(sqrt(d)) and of the primes ramified in it, built with a segmented
+    sieve rather than by factoring each discriminant. The Trbovic filter
+    and the Oezman sieve both start from these primes.
+
+    For the Trbovic filter only the primes appearing in some list of
+    unramified primes of the quadratic points catalogue matter. Giving each
+    of them a bit, every d gets a mask of its ramified catalogue primes and
+    every level N a mask of its unramified primes, and the filter applies
+    to (d, N) iff the two masks meet. So for a whole range of d and a list
+    of levels the filter is a single AND of two NumPy arrays.
+
+    ====================================================================
+
+    This file is part of Quadratic Kenku Solver.
+
+    Copyright (C) 2022 Barinder S. Banwait, Filip Najman, and Oana
+    Padurariu
+
+    Quadratic Kenku Solver is free software: you can redistribute it
+    and/or modify it under the terms of the GNU General Public License
+    as published by the Free Software Foundation, either version 3 of
+    the License, or any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+    ====================================================================
+
+"""
+
+from math import isqrt
+
+import numpy as np
+
+from sieves import (
+    prime_divisors,
+    prime_factors_in_segment,
+    primes_up_to,
+    squarefree_in_segment,
+)
+
+SEGMENT_SIZE = 10000
+# Smaller batches of d which the shared index does not have are done by
+# trial division rather than with an index of their own
+MIN_INDEXED_BATCH = 1000
+
+
+def ramified_primes_of(d):
+    """The primes dividing the discriminant of Q(sqrt(d)), for squarefree d,
+    by trial division"""
+
+    ram_primes = prime_divisors(d)
+    if d % 4 != 1 and 2 not in ram_primes:
+        ram_primes = [2] + ram_primes
+    return ram_primes
+
+
+def prime_bits(unramified_primes_by_level):
+    """Dictionary p -> bit for the primes in any of the given lists"""
+
+    all_primes = sorted(
+        {p for primes in unramified_primes_by_level.values() for p in primes}
+    )
+    if len(all_primes) > 64:
+        raise ValueError(f"{len(all_primes)} primes do not fit in a 64-bit mask")
+    return {p: i for i, p in enumerate(all_primes)}
+
+
+def prime_mask(primes, bits):
+    """The mask of those primes in `primes` which have a bit"""
+
+    return sum(1 << bits[p] for p in primes if p in bits)
+
+
+class DiscriminantIndex:
+    """The squarefree d != 0, 1 with d_start <= d < d_end, their
+    discriminants and ramified primes"""
+
+    def __init__(self, d_start, d_end, segment_size=SEGMENT_SIZE):
+        self.d_start = d_start
+        self.d_end = d_end
+
+        primes = primes_up_to(isqrt(max(abs(d_start), abs(d_end - 1), 4)))
+        d_vals = []
+        offsets = [0]
+        flat_primes = []
+
+        for lo in range(d_start, d_end, segment_size):
+            hi = min(lo + segment_size, d_end)
+            factors = prime_factors_in_segment(lo, hi, primes)
+            for d in squarefree_in_segment(lo, hi, primes):
+                if d == 1:
+                    continue
+                ram_primes = factors[d - lo]
+                if d % 4 != 1 and 2 not in ram_primes:
+                    ram_primes = [2] + ram_primes
+                d_vals.append(d)
+                flat_primes += ram_primes
+                offsets.append(len(flat_primes))
+
+        self.d_vals = np.array(d_vals, dtype=np.int64)
+        self.discs = np.where(self.d_vals % 4 == 1, self.d_vals, 4 * self.d_vals)
+        self._offsets = np.array(offsets, dtype=np.int64)
+        self._primes = np.array(flat_primes, dtype=np.int64)
+        self._row_of = np.full(d_end - d_start, -1, dtype=np.int64)
+        self._row_of[self.d_vals - d_start] = np.arange(len(d_vals))
+        self._masks = {}
+
+    def covers(self, d_vals):
+        return all(
+            self.d_start <= d < self.d_end and self._row_of[d - self.d_start] >= 0
+            for d in d_vals
+        )
+
+    def rows(self, d_vals):
+        d_arr = np.array([int(d) for d in d_vals], dtype=np.int64)
+        rows = self._row_of[d_arr - self.d_start]
+        if (rows < 0).any():
+            raise ValueError("the index only has squarefree d != 0, 1")
+        return rows
+
+    def ramified_primes(self, d):
+        row = self._row_of[d - self.d_start]
+        return self._primes[self._offsets[row] : self._offsets[row + 1]].tolist()
+
+    def ramified_masks(self, bits):
+        """uint64 array, aligned with `d_vals`, of the masks of ramified
+        primes with a bit; computed once per set of bits"""
+
+        key = tuple(sorted(bits.items()))
+        if key not in self._masks:
+            masks = np.zeros(len(self.d_vals), dtype=np.uint64)
+            for p, bit in bits.items():
+                masks |= (self.discs % p == 0).astype(np.uint64) << np.uint64(bit)
+            self._masks[key] = masks
+        return self._masks[key]
+
+
+_shared_index = None
+
+
+def build_shared_index(d_start, d_end):
+    """Builds the index which `ramified_primes` and `ramified_masks` use
+    for the d in [d_start, d_end). Worker processes forked afterwards share
+    it."""
+
+    global _shared_index
+    _shared_index = DiscriminantIndex(d_start, d_end)
+    return _shared_index
+
+
+def index_for(d_vals):
+    """The shared index if it has all of `d_vals`. Otherwise None for
+    fewer than `MIN_INDEXED_BATCH` d, and else a new index for the smallest
+    range containing them, which becomes the shared one only if there is
+    none yet: a shared index is never replaced."""
+
+    d_vals = [int(d) for d in d_vals]
+    if _shared_index is not None and _shared_index.covers(d_vals):
+        return _shared_index
+    if len(d_vals) < MIN_INDEXED_BATCH:
+        return None
+    if _shared_index is None:
+        return build_shared_index(min(d_vals), max(d_vals) + 1)
+    return DiscriminantIndex(min(d_vals), max(d_vals) + 1)
+
+
+def ramified_primes(d):
+    """The primes ramified in Q(sqrt(d)), from the shared index if it has
+    d"""
+
+    d = int(d)
+    if _shared_index is not None and _shared_index.covers([d]):
+        return _shared_index.ramified_primes(d)
+    return ramified_primes_of(d)
+
+
+def ramified_masks(d_vals, bits):
+    """uint64 array of the masks of ramified primes with a bit, one per d"""
+
+    if not d_vals:
+        return np.zeros(0, dtype=np.uint64)
+    index = index_for(d_vals)
+    if index is None:
+        return np.array(
+            [prime_mask(ramified_primes_of(int(d)), bits) for d in d_vals],
+            dtype=np.uint64,
+        )
+    return index.ramified_masks(bits)[index.rows(d_vals)]
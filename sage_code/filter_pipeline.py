@@ -0,0 +1,210 @@
+"""filter_pipeline.py
+
+    The engine behind `very_convenient_vals`. For each d there is a list of
+    hard values z, and each z is removed if one of its "removers" holds,
+    where a remover is a conjunction of named checks, for example
+
+        [("mwgp_minus",), ("mwgp_plus", "oezman")]
+
+    removes z if the minus check holds, or if both the plus check and the
+    Oezman sieve do. A check is a function of (d, z) returning True when it
+    speaks for removing z. Since the checks have no side effects, they may
+    be run in any order:
+
+        - the checks of a remover are run cheapest first, adjusted for how
+          often each one fails, and a remover stops at its first failing
+          check;
+        - the removers of z are run in increasing order of expected cost
+          per removal, and z is done at the first remover which holds;
+        - a d is done at the first z which no remover removes, as that d is
+          then not very convenient.
+
+    Costs and hit rates start from priors and are then measured. The d
+    values are spread over a process pool, in rounds, and the measurements
+    of each round order the checks of the next.
+
+    ====================================================================
+
+    This file is part of Quadratic Kenku Solver.
+
+    Copyright (C) 2022 Barinder S. Banwait, Filip Najman, and Oana
+    Padurariu
+
+    Quadratic Kenku Solver is free software: you can redistribute it
+    and/or modify it under the terms of the GNU General Public License
+    as published by the Free Software Foundation, either version 3 of
+    the License, or any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+    ====================================================================
+
+"""
+
+import logging
+import os
+import time
+from multiprocessing import Pool
+
+logger = logging.getLogger(__name__)
+
+# Number of d values per worker in each round
+ROUND_SIZE_PER_WORKER = 4
+
+
+def new_stats(check_names):
+    """Per check: [runs, hits (returned True), total seconds]; per remover
+    (a tuple of check names): the number of z it removed"""
+
+    return {"checks": {name: [0, 0, 0.0] for name in check_names}, "removers": {}}
+
+
+def merge_stats(stats, more_stats):
+
+    for name, (runs, hits, seconds) in more_stats["checks"].items():
+        entry = stats["checks"].setdefault(name, [0, 0, 0.0])
+        entry[0] += runs
+        entry[1] += hits
+        entry[2] += seconds
+    for remover, count in more_stats["removers"].items():
+        stats["removers"][remover] = stats["removers"].get(remover, 0) + count
+
+
+def estimates(stats, priors):
+    """Dictionary check name -> (mean seconds, chance of returning True).
+    The prior cost counts as one run; the chance is smoothed."""
+
+    output = {}
+    for name, (runs, hits, seconds) in stats["checks"].items():
+        mean_cost = (priors.get(name, 1.0) + seconds) / (runs + 1)
+        output[name] = (mean_cost, (hits + 1) / (runs + 2))
+    return output
+
+
+def order_removers(removers, check_estimates):
+    """Sorts each remover's checks by cost per chance of stopping it, and
+    the removers by expected cost per chance of removing z"""
+
+    ordered = []
+
+    for remover in removers:
+        checks = sorted(
+            remover,
+            key=lambda name: check_estimates[name][0]
+            / max(1 - check_estimates[name][1], 1e-9),
+        )
+        expected_cost = 0.0
+        chance = 1.0
+        for name in checks:
+            cost, hit_rate = check_estimates[name]
+            expected_cost += chance * cost
+            chance *= hit_rate
+        ordered.append((expected_cost / max(chance, 1e-9), tuple(checks), remover))
+
+    return [(checks, remover) for _, checks, remover in sorted(ordered)]
+
+
+def _is_removed(d, z, removers, checks, check_estimates, stats):
+    """Whether some remover removes z, running as few checks as possible"""
+
+    results = {}
+
+    for ordered_checks, remover in order_removers(removers, check_estimates):
+        holds = True
+        for name in ordered_checks:
+            if name not in results:
+                start = time.perf_counter()
+                results[name] = bool(checks[name](d, z))
+                entry = stats["checks"][name]
+                entry[0] += 1
+                entry[1] += results[name]
+                entry[2] += time.perf_counter() - start
+            if not results[name]:
+                holds = False
+                break
+        if holds:
+            stats["removers"][remover] = stats["removers"].get(remover, 0) + 1
+            return True
+
+    return False
+
+
+def filter_d(d, hard_vals, checks, check_estimates):
+    """Runs the removers of each (z, removers) in `hard_vals` in turn, and
+    returns (d, the first z not removed or None, stats)"""
+
+    stats = new_stats(checks)
+
+    for z, removers in hard_vals:
+        if not _is_removed(d, z, removers, checks, check_estimates, stats):
+            return d, z, stats
+
+    return d, None, stats
+
+
+def _filter_d_worker(args):
+    return filter_d(*args)
+
+
+def run_filter_pipeline(tasks, checks, priors, num_workers=None):
+    """Runs `filter_d` on each (d, hard_vals) of `tasks`, with the checks
+    given as a dictionary name -> function of (d, z) and the prior mean
+    cost of each in seconds. With `num_workers` (0 for no pool) the tasks
+    are spread over a process pool, a round at a time.
+
+    Returns a dictionary d -> first surviving z (None if all were removed)
+    and the combined stats."""
+
+    tasks = list(tasks)
+    stats = new_stats(checks)
+    survivors = {}
+
+    def record(result):
+        d, z, d_stats = result
+        survivors[d] = z
+        merge_stats(stats, d_stats)
+        if z is None:
+            logger.info(f"{d}: every hard value removed")
+        else:
+            logger.info(f"{d}: {z} survives")
+
+    if num_workers == 0:
+        for d, hard_vals in tasks:
+            record(filter_d(d, hard_vals, checks, estimates(stats, priors)))
+        return survivors, stats
+
+    with Pool(num_workers) as pool:
+        round_size = ROUND_SIZE_PER_WORKER * (num_workers or os.cpu_count())
+        for i in range(0, len(tasks), round_size):
+            check_estimates = estimates(stats, priors)
+            round_args = [
+                (d, hard_vals, checks, check_estimates)
+                for d, hard_vals in tasks[i : i + round_size]
+            ]
+            for result in pool.imap_unordered(_filter_d_worker, round_args):
+                record(result)
+
+    return survivors, stats
+
+
+def format_stats(stats):
+    """A table of the runs, hit rate and mean time of each check, and of the
+    number of values removed by each remover"""
+
+    lines = [f"{'check':<12}{'runs':>8}{'hit rate':>10}{'mean ms':>12}"]
+    for name, (runs, hits, seconds) in sorted(stats["checks"].items()):
+        hit_rate = hits / runs if runs else 0.0
+        mean_ms = 1000 * seconds / runs if runs else 0.0
+        lines.append(f"{name:<12}{runs:>8}{hit_rate:>10.2%}{mean_ms:>12.3f}")
+
+    lines.append("removed by:")
+    for remover, count in sorted(stats["removers"].items(), key=lambda x: -x[1]):
+        lines.append(f"    {' and '.join(remover):<30}{count:>6}")
+
+    return "\n".join(lines)
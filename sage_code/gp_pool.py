@@ -0,0 +1,247 @@
+"""gp_pool.py
+
+    A pool of long-lived PARI workers for the isogeny class computations
+    which Sage cannot do (see `isogeny_graphs.py`).
+
+    These used to go through the GP interface one j-invariant at a time:
+    about seven commands per j-invariant, sent as strings, with `nfinit`
+    redone every time and GP killed at the end, so that every call paid for
+    starting GP again. Here each worker is a child process running the same
+    PARI commands through the library. It keeps one `nfinit` per d, takes a
+    whole batch of curves per request, and sends back, for each of them,
+    the curves of its isogeny class and the isogeny matrix as plain Python
+    integers. The curves are sent as a-invariants rather than built from
+    their j-invariants with `ellfromj`, so that small models can be used
+    (see `twist_selection.py`).
+
+    A worker is only restarted when it has to be: when it crashes, when
+    PARI runs out of stack even at its maximal size, or when a curve
+    takes longer than the deadline, in which case it is killed.
+
+    ====================================================================
+
+    This file is part of Quadratic Kenku Solver.
+
+    Copyright (C) 2022 Barinder S. Banwait, Filip Najman, and Oana
+    Padurariu
+
+    Quadratic Kenku Solver is free software: you can redistribute it
+    and/or modify it under the terms of the GNU General Public License
+    as published by the Free Software Foundation, either version 3 of
+    the License, or any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+    ====================================================================
+
+"""
+
+import atexit
+import logging
+import time
+from multiprocessing import Pipe, Process
+from multiprocessing.connection import wait
+
+from sage.all import pari
+
+logger = logging.getLogger(__name__)
+
+NUM_GP_WORKERS = 2
+# PARI starts with this stack, and may double it up to the maximal size
+GP_PARISIZE = 256000000
+GP_PARISIZEMAX = 2048000000
+GP_DEADLINE_S = 30
+
+# The status of the result for each curve
+OK = "ok"
+ERROR = "error"
+MEMORY = "memory"
+CRASHED = "crashed"
+TIMEOUT = "timeout"
+
+
+def _rational_pair(x):
+    return int(pari.numerator(x)), int(pari.denominator(x))
+
+
+def _field_element(x):
+    """The coordinates of an element of Q(a), a^2 = d, in the basis 1, a, as
+    (numerator, denominator) pairs"""
+
+    x = pari.lift(x)
+    return [_rational_pair(pari.polcoef(x, k, "a")) for k in range(2)]
+
+
+def isogeny_class_of(K_nf, d, a_coeffs):
+    """The curves in the isogeny class of the curve whose a-invariants are
+    the c[0] + c[1] * a for c in `a_coeffs`, as lists of coefficients, and
+    the isogeny matrix, as a list of rows"""
+
+    a_invs = [pari(f"Mod({c0} + ({c1}) * a, a ^ 2 - {d})") for c0, c1 in a_coeffs]
+    E = pari.ellinit(a_invs, K_nf)
+    L, M = pari.ellisomat(E, 1)
+
+    curves = [[_field_element(c) for c in e_rep] for e_rep in L]
+    rows = [[int(M[i, k]) for k in range(M.ncols())] for i in range(M.nrows())]
+    return curves, rows
+
+
+def _worker_main(conn, parisize, parisizemax):
+    """The loop of a worker: requests are (d, list of curves), and each
+    curve gets one reply (status, result), in order"""
+
+    pari.allocatemem(parisize, parisizemax, silent=True)
+    fields = {}
+
+    while True:
+        request = conn.recv()
+        if request is None:
+            break
+        d, curves = request
+
+        for a_coeffs in curves:
+            try:
+                if d not in fields:
+                    fields[d] = pari(f"nfinit(a ^ 2 - {d})")
+                conn.send((OK, isogeny_class_of(fields[d], d, a_coeffs)))
+            except Exception as err_msg:
+                if "stack overflows" in str(err_msg):
+                    # start afresh rather than carry on with a full stack
+                    conn.send((MEMORY, str(err_msg)))
+                    return
+                conn.send((ERROR, str(err_msg)))
+
+    conn.close()
+
+
+class GPWorker:
+    """One worker process and the connection to it"""
+
+    def __init__(self, parisize=GP_PARISIZE, parisizemax=GP_PARISIZEMAX):
+        self.parisize = parisize
+        self.parisizemax = parisizemax
+        self.process = None
+        self.conn = None
+        self.restarts = 0
+
+    def start(self):
+        self.conn, child_conn = Pipe()
+        self.process = Process(
+            target=_worker_main,
+            args=(child_conn, self.parisize, self.parisizemax),
+            daemon=True,
+        )
+        self.process.start()
+        child_conn.close()
+
+    def is_alive(self):
+        return self.process is not None and self.process.is_alive()
+
+    def kill(self):
+        if self.process is not None:
+            self.process.kill()
+            self.process.join()
+            self.conn.close()
+            self.process = None
+            self.conn = None
+
+    def restart(self):
+        self.kill()
+        self.start()
+        self.restarts += 1
+
+    def stop(self):
+        if self.is_alive():
+            try:
+                self.conn.send(None)
+                self.process.join(5)
+            except (BrokenPipeError, OSError):
+                pass
+        self.kill()
+
+
+class GPWorkerPool:
+    """`num_workers` workers, started on first use"""
+
+    def __init__(self, num_workers=NUM_GP_WORKERS, deadline=GP_DEADLINE_S):
+        self.deadline = deadline
+        self.workers = [GPWorker() for _ in range(num_workers)]
+
+    def _send(self, worker, d, curves):
+        if not worker.is_alive():
+            if worker.process is not None:
+                logger.info("Restarting a PARI worker which has died")
+                worker.restart()
+            else:
+                worker.start()
+        worker.conn.send((d, curves))
+
+    def isogeny_classes(self, d, curves):
+        """The isogeny class of each curve over Q(sqrt(d)), given by its five
+        a-invariants, each given by its coordinates in the basis 1, sqrt(d).
+        Each result is a pair (status, result), where result is (curves,
+        matrix) as in `isogeny_class_of` if the status is OK, and a message
+        otherwise."""
+
+        curves = [[[str(c) for c in a] for a in a_coeffs] for a_coeffs in curves]
+        results = [None] * len(curves)
+
+        # worker -> [indices still to be done, time the first one started]
+        pending = {}
+        for w, worker in enumerate(self.workers):
+            indices = list(range(w, len(curves), len(self.workers)))
+            if indices:
+                self._send(worker, d, [curves[i] for i in indices])
+                pending[worker] = [indices, time.monotonic()]
+
+        def restart_and_resend(worker):
+            indices = pending[worker][0]
+            if not indices:
+                # restarted when next needed
+                worker.kill()
+                return
+            worker.restart()
+            self._send(worker, d, [curves[i] for i in indices])
+            pending[worker][1] = time.monotonic()
+
+        while pending:
+            by_conn = {worker.conn: worker for worker in pending}
+            first_deadline = min(start for _, start in pending.values()) + self.deadline
+            ready = wait(list(by_conn), timeout=max(0, first_deadline - time.monotonic()))
+
+            for conn in ready:
+                worker = by_conn[conn]
+                indices = pending[worker][0]
+                try:
+                    status, result = conn.recv()
+                except EOFError:
+                    status, result = CRASHED, "the PARI worker died"
+                results[indices.pop(0)] = (status, result)
+                pending[worker][1] = time.monotonic()
+                if status in (MEMORY, CRASHED):
+                    logger.info(f"Restarting a PARI worker: {result}")
+                    restart_and_resend(worker)
+
+            now = time.monotonic()
+            for worker, (indices, start) in list(pending.items()):
+                if indices and now - start > self.deadline:
+                    results[indices.pop(0)] = (TIMEOUT, "PARI took too long")
+                    restart_and_resend(worker)
+                if not indices:
+                    del pending[worker]
+
+        return results
+
+    def close(self):
+        for worker in self.workers:
+            worker.stop()
+
+
+gp_pool = GPWorkerPool()
+atexit.register(gp_pool.close)
@@ -30,28 +30,54 @@ This verifies the claims in Section 6 of the paper.
 # apart from N = 37, the Trbovic filter method applies
 
 import json
+import numpy as np
 from sage.all import Integer
 
+from disc_index import prime_bits, prime_mask, ramified_masks, ramified_primes
+
 
 QUADRATIC_POINTS_DATA_PATH = "quadratic_points_catalogue.json"
 
 with open(QUADRATIC_POINTS_DATA_PATH, "r") as qdpts_dat_file:
     qdpts_dat = json.load(qdpts_dat_file)
 
+# Each prime in some list of unramified primes gets a bit, and each level
+# the mask of its unramified primes; see `disc_index.py`
+UNRAMIFIED_PRIME_BITS = prime_bits(
+    {N: data["unramified_primes"] for N, data in qdpts_dat.items()}
+)
+UNRAMIFIED_MASKS = {
+    int(N): prime_mask(data["unramified_primes"], UNRAMIFIED_PRIME_BITS)
+    for N, data in qdpts_dat.items()
+}
 
-def try_trbovic_filter(d, N):
 
-    disc_of_quad_field = Integer(d if d % 4 == 1 else 4 * d)
-    ram_primes = disc_of_quad_field.prime_divisors()
+def try_trbovic_filter(d, N):
 
-    data_this_N = qdpts_dat[str(N)]
-    unram_primes = data_this_N["unramified_primes"]
-    absurd_intersection = set(unram_primes).intersection(set(ram_primes))
-    if len(absurd_intersection) > 0:
+    ram_mask = prime_mask(ramified_primes(d), UNRAMIFIED_PRIME_BITS)
+    absurd_intersection = ram_mask & UNRAMIFIED_MASKS[int(N)]
+    if absurd_intersection:
         return False
     return True
 
 
+def batch_try_trbovic_filter(d_vals, levels):
+    """Dictionary (d, N) -> `try_trbovic_filter(d, N)` for all d in `d_vals`
+    and N in `levels`, from one AND of the masks of the two"""
+
+    d_vals = list(d_vals)
+    levels = list(levels)
+    ram_masks = ramified_masks(d_vals, UNRAMIFIED_PRIME_BITS)
+    unram_masks = np.array([UNRAMIFIED_MASKS[int(N)] for N in levels], dtype=np.uint64)
+    passes = (ram_masks[:, None] & unram_masks[None, :]) == 0
+
+    return {
+        (d, N): bool(passes[i, j])
+        for i, d in enumerate(d_vals)
+        for j, N in enumerate(levels)
+    }
+
+
 # The following does the verification
 
 
@@ -0,0 +1,420 @@
+"""isogeny_cache.py
+
+    A persistent cache of the isogeny classes computed by
+    `isogeny_graphs.py`: for each d and each j-invariant j in Q(sqrt(d)),
+    the j-invariants of the curves in the isogeny class of E(j) over
+    Q(sqrt(d)) and the matrix of isogeny degrees between them.
+
+    Rational j-invariants (the Q-rational points on X_0(37), the rational
+    CM j-invariants, rational points in the catalogue) come up for many d,
+    so they have a tier of their own, independent of d. For rational j it
+    holds the isogeny class of E(j) over Q, together with a finite set of
+    exceptional d outside which the class over Q(sqrt(d)) is the same. If
+    some curve E' of the class over Q had an l-isogeny over K = Q(sqrt(d))
+    which is not over Q, its kernel C and the conjugate of C would be two
+    distinct K-rational lines in E'[l], so the mod l image of E' over Q
+    would lie in the normaliser of a split Cartan subgroup. For E' without
+    CM this only happens for l <= 7 (Bilu-Parent-Rebolledo, and
+    Balakrishnan-Dogra-Muller-Tuitman-Vonk for l = 13). For E' with CM by
+    an order in F, it happens for all l split in F, but then K = F, while
+    l ramified in F gives a unique stable line. So the exceptional d are:
+
+        - those for which K is a quadratic subfield of Q[x]/(g) for an
+          irreducible factor g of even degree of the l-division polynomial
+          of some E' in the class, l = 2, 3, 5, 7; over such K only, g can
+          split into two factors, one of them a kernel polynomial;
+        - the d of the CM field, if E(j) has CM;
+        - the d by which two curves of the class are quadratic twists of
+          each other, as these become isomorphic over K.
+
+    For all other d the cached class over Q is used. The class over Q is
+    read from the Cremona database bundled with Sage where the curve (or
+    its minimal quadratic twist, which has the same class up to twists) is
+    in it. For the exceptional d other than that of a CM field, the class
+    over K is the class of E(j) over K with isogenies of the degrees of
+    the class over Q and the l above which gave the d only, so it is
+    computed with just these as its reducible primes rather than from
+    scratch. For the d of a CM field, and for j not in Q, the class is
+    computed over K in `isogeny_graphs.py`. Either way it is cached under
+    (d, j). Running this file computes the classes of all j-invariants in
+    the quadratic points catalogue ahead of a run of the solver.
+
+    The cache is an SQLite database in WAL mode, like `verdict_store.py`.
+
+    ====================================================================
+
+    This file is part of Quadratic Kenku Solver.
+
+    Copyright (C) 2022 Barinder S. Banwait, Filip Najman, and Oana
+    Padurariu
+
+    Quadratic Kenku Solver is free software: you can redistribute it
+    and/or modify it under the terms of the GNU General Public License
+    as published by the Free Software Foundation, either version 3 of
+    the License, or any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+    ====================================================================
+
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import time
+
+from sage.all import QQ, ZZ, EllipticCurve, Matrix, NumberField
+
+from deadline_executor import OK, run_with_deadline
+
+logger = logging.getLogger(__name__)
+
+ISOGENY_CACHE_PATH = "isogeny_classes.sqlite"
+# How long a writer waits for another one before giving up, in seconds
+LOCK_TIMEOUT_S = 120
+RATIONAL_CLASS_DEADLINE_S = 30
+
+# The l for which a curve over Q without CM can have an l-isogeny over a
+# quadratic field which is not over Q. Its mod l image then lies in the
+# normaliser of a split Cartan subgroup, and for l >= 11 only curves with
+# CM have such images: Bilu-Parent-Rebolledo, "Rational points on
+# X_0^+(p^r)" (2013), for l >= 11 with l != 13, and Balakrishnan-Dogra-
+# Muller-Tuitman-Vonk, "Explicit Chabauty-Kim for the split Cartan modular
+# curve of level 13" (2019), for l = 13
+SPLIT_CARTAN_PRIMES = (2, 3, 5, 7)
+# The primes ruled out above, which `check_rational_tier` tests as well
+CHECKED_PRIMES = SPLIT_CARTAN_PRIMES + (11, 13)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS isogeny_classes (
+    d INTEGER NOT NULL,
+    j TEXT NOT NULL,
+    j_invs TEXT NOT NULL,
+    matrix TEXT NOT NULL,
+    seconds REAL NOT NULL,
+    PRIMARY KEY (d, j)
+);
+CREATE TABLE IF NOT EXISTS rational_tier (
+    j TEXT PRIMARY KEY,
+    j_invs TEXT NOT NULL,
+    matrix TEXT NOT NULL,
+    exceptional_d TEXT NOT NULL,
+    seconds REAL NOT NULL
+)
+"""
+
+
+def j_key(K, j):
+    """The coordinates of j in the basis 1, sqrt(d) of K, as a string"""
+
+    return ",".join(str(c) for c in list(K(j)))
+
+
+def _encode_class(K, jInvs, M):
+    return json.dumps([j_key(K, j) for j in jInvs]), json.dumps(
+        [[int(a) for a in row] for row in M]
+    )
+
+
+def _decode_class(K, j_invs, matrix):
+    jInvs = [K([QQ(c) for c in key.split(",")]) for key in json.loads(j_invs)]
+    return jInvs, Matrix(ZZ, json.loads(matrix))
+
+
+def _torsion_polynomial(F, l):
+    """The polynomial in x whose roots are the x-coordinates of the points
+    of order l of F. For l = 2, `division_polynomial` with its default
+    arguments only has a factor 2y + a1 x + a3 in y, whose square is this
+    cubic."""
+
+    if l == 2:
+        return F.two_division_polynomial()
+    return F.division_polynomial(l)
+
+
+def exceptional_d_values(C):
+    """The squarefree d for which the isogeny class C over Q of a curve
+    may differ from its class over Q(sqrt(d)), see the top of this file,
+    as a dictionary mapping each d to the sorted primes l which may have
+    new l-isogenies over Q(sqrt(d)), or to None for the d of a CM field"""
+
+    exceptional = {}
+    curves = list(C)
+
+    def add(d, l=None):
+        d = int(ZZ(d).squarefree_part())
+        primes = exceptional.setdefault(d, set())
+        if primes is not None and l is not None:
+            primes.add(l)
+
+    for F in curves:
+        if F.has_cm():
+            exceptional[int(ZZ(F.cm_discriminant()).squarefree_part())] = None
+        for l in SPLIT_CARTAN_PRIMES:
+            for g, _ in _torsion_polynomial(F, l).factor():
+                if g.degree() % 2 == 0:
+                    L = NumberField(g, "t")
+                    for sub, _, _ in L.subfields(2):
+                        add(sub.discriminant(), l)
+
+    for i, F1 in enumerate(curves):
+        for F2 in curves[i + 1 :]:
+            if F1.j_invariant() == F2.j_invariant():
+                twist = F1.is_quadratic_twist(F2)
+                if twist == 0:
+                    # quartic or sextic twists: no d is safe
+                    return None
+                add(twist)
+
+    return {
+        d: None if primes is None else sorted(primes)
+        for d, primes in sorted(exceptional.items())
+    }
+
+
+def rational_class(j):
+    """The isogeny class over Q of E(j), or of a quadratic twist of it with
+    the same j-invariants and degrees, from the Cremona database if the
+    curve is in it"""
+
+    E = EllipticCurve(j=QQ(j))
+    if j not in (0, 1728):
+        E = E.minimal_quadratic_twist()[0]
+    try:
+        return E.isogeny_class(algorithm="database")
+    except Exception as err_msg:
+        logger.debug(f"E({j}) is not in the Cremona database: {err_msg}")
+        return E.isogeny_class()
+
+
+def class_over_quadratic_field(K, j, matrix, primes):
+    """The isogeny class (j-invariants, matrix) over K of E(j), for j in Q,
+    given the matrix of its class over Q and the primes which may have new
+    isogenies over K: only these and the primes of the degrees over Q are
+    reducible"""
+
+    reducible = {int(l) for row in matrix for a in row for l in ZZ(a).prime_factors()}
+    reducible.update(primes)
+
+    E = EllipticCurve(j=QQ(j))
+    if j not in (0, 1728):
+        E = E.minimal_quadratic_twist()[0]
+    C = E.change_ring(K).isogeny_class(
+        reducible_primes=sorted(reducible), minimal_models=False
+    )
+    return [F.j_invariant() for F in C], C.matrix()
+
+
+class IsogenyCache:
+    """The isogeny classes, stored at `path`"""
+
+    def __init__(self, path=ISOGENY_CACHE_PATH):
+        self.path = path
+        self._conn = None
+        self._pid = None
+        self._rational = {}
+
+    def _connection(self):
+        # a connection must not cross a fork, so worker processes open their own
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.path, timeout=LOCK_TIMEOUT_S)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            with self._conn:
+                self._conn.executescript(SCHEMA)
+                self._drop_old_rational_tier()
+            self._pid = os.getpid()
+        return self._conn
+
+    def _drop_old_rational_tier(self):
+        # `rational_classes` missed the d over which a curve gains a
+        # 2-isogeny, so it goes, with the classes of rational j over the d
+        # it was used for
+        old = self._conn.execute(
+            "SELECT name FROM sqlite_master WHERE name = 'rational_classes'"
+        ).fetchone()
+        if old is not None:
+            self._conn.execute("DELETE FROM isogeny_classes WHERE j LIKE '%,0'")
+            self._conn.execute("DROP TABLE rational_classes")
+
+    def rational_entry(self, j):
+        """(j-invariants, matrix, exceptional d) for the rational j, with
+        the exceptional d as in `exceptional_d_values`, or None if no d is
+        safe; computed if need be"""
+
+        j = QQ(j)
+        if j in self._rational:
+            return self._rational[j]
+
+        conn = self._connection()
+        row = conn.execute(
+            "SELECT j_invs, matrix, exceptional_d FROM rational_tier WHERE j = ?",
+            (str(j),),
+        ).fetchone()
+
+        if row is None:
+            start = time.perf_counter()
+            C = rational_class(j)
+            exceptional = exceptional_d_values(C)
+            row = (
+                json.dumps([str(F.j_invariant()) for F in C]),
+                json.dumps([[int(a) for a in r] for r in C.matrix()]),
+                json.dumps(exceptional),
+            )
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO rational_tier VALUES (?, ?, ?, ?, ?)",
+                    (str(j),) + row + (time.perf_counter() - start,),
+                )
+
+        j_invs, matrix, exceptional = row
+        exceptional = json.loads(exceptional)
+        if exceptional is not None:
+            exceptional = {int(d): primes for d, primes in exceptional.items()}
+
+        self._rational[j] = (
+            [QQ(a) for a in json.loads(j_invs)],
+            json.loads(matrix),
+            exceptional,
+        )
+        return self._rational[j]
+
+    def lookup(self, K, d, j):
+        """The isogeny class (j-invariants, matrix) of E(j) over K = Q(sqrt(d))
+        if it is cached, or can be read off the rational tier, or, for j in Q
+        and d exceptional but not that of a CM field, computed from it; else
+        None"""
+
+        d = int(d)
+        j = K(j)
+
+        exceptional = None
+        if j in QQ:
+            try:
+                jInvs, matrix, exceptional = self.rational_entry(QQ(j))
+            except Exception as err_msg:
+                logger.warning(f"No rational tier entry for {j}: {err_msg}")
+            if exceptional is not None and d not in exceptional:
+                return [K(a) for a in jInvs], Matrix(ZZ, matrix)
+
+        row = self._connection().execute(
+            "SELECT j_invs, matrix FROM isogeny_classes WHERE d = ? AND j = ?",
+            (d, j_key(K, j)),
+        ).fetchone()
+        if row is not None:
+            return _decode_class(K, *row)
+
+        if exceptional is not None and exceptional[d] is not None:
+            outcome = run_with_deadline(
+                class_over_quadratic_field,
+                K,
+                QQ(j),
+                matrix,
+                exceptional[d],
+                deadline=RATIONAL_CLASS_DEADLINE_S,
+            )
+            if outcome.status == OK:
+                self.record(K, d, j, *outcome.value, outcome.seconds)
+                return outcome.value
+            logger.info(f"Class of {j} over Q(sqrt({d})) failed: {outcome.value}")
+
+        return None
+
+    def record(self, K, d, j, jInvs, M, seconds):
+        """Stores the isogeny class of E(j) over K = Q(sqrt(d))"""
+
+        j_invs, matrix = _encode_class(K, jInvs, M)
+        with self._connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO isogeny_classes VALUES (?, ?, ?, ?, ?)",
+                (int(d), j_key(K, j), j_invs, matrix, seconds),
+            )
+
+
+isogeny_cache = IsogenyCache()
+
+
+def _degrees(C):
+    jInvs, M = C
+    return {
+        (j1, j2, int(M[r][c]))
+        for r, j1 in enumerate(jInvs)
+        for c, j2 in enumerate(jInvs)
+    }
+
+
+def check_rational_tier(ds=()):
+    """Checks the rational tier. First a known case of exceptional d:
+    y^2 = x^3 - 15x + 22 = (x - 2)(x^2 + 2x - 11), with j = 54000, gains a
+    2-isogeny over Q(sqrt(3)). Then, for each rational CM j-invariant and
+    each d in `ds` other than that of its CM field, the class which
+    `lookup` gives must be the class over Q(sqrt(d)) computed with all of
+    `CHECKED_PRIMES` as reducible primes."""
+
+    from sage.all import QuadraticField, cm_j_invariants
+
+    C = rational_class(54000)
+    exceptional = exceptional_d_values(C)
+    assert exceptional is not None and 2 in exceptional.get(3, []), exceptional
+
+    K = QuadraticField(3, "K_gen")
+    jInvs, _ = class_over_quadratic_field(K, 54000, C.matrix(), [2])
+    assert len(set(jInvs)) > len({F.j_invariant() for F in C}), jInvs
+
+    for j in cm_j_invariants(QQ):
+        _, matrix, exceptional = isogeny_cache.rational_entry(j)
+        for d in sorted(set(ds)):
+            if exceptional is None or exceptional.get(d, []) is None:
+                # computed over K in `isogeny_graphs.py`
+                continue
+            K = QuadraticField(d, "K_gen")
+            tier_class = isogeny_cache.lookup(K, d, j)
+            if tier_class is None:
+                logger.warning(f"No class from the rational tier for j = {j}, d = {d}")
+                continue
+            full_class = class_over_quadratic_field(K, j, matrix, CHECKED_PRIMES)
+            assert _degrees(tier_class) == _degrees(full_class), (j, d)
+            logger.info(f"Rational tier agrees for j = {j}, d = {d}")
+
+
+def warm_isogeny_cache(num_workers=None):
+    """Computes the isogeny classes of all j-invariants in the quadratic
+    points catalogue, and the rational tier of the rational points on
+    X_0(37) and of the rational CM j-invariants"""
+
+    from sage.all import QuadraticField, cm_j_invariants
+
+    from isogeny_graphs import isogeny_classes
+    from quadratic_kenku_solver import unique_j_inv_count
+    from utils import qdpts_dat
+
+    for j in [-162677523113838677, -9317] + list(cm_j_invariants(QQ)):
+        isogeny_cache.rational_entry(j)
+
+    for N, data_this_N in sorted(qdpts_dat.items(), key=lambda x: int(x[0])):
+        for d, j_invs_str in data_this_N["non_cm_points"].items():
+            K = QuadraticField(int(d), "K_gen")
+            _, j_inv_list = unique_j_inv_count(j_invs_str, K.gen())
+            logger.info(f"N = {N}, d = {d}: {len(j_inv_list)} j-invariants")
+            isogeny_classes(K, j_inv_list, int(d), num_workers)
+
+
+if __name__ == "__main__":
+    from utils import qdpts_dat
+
+    logging.basicConfig(level=logging.INFO)
+    catalogue_ds = {
+        int(d)
+        for data_this_N in qdpts_dat.values()
+        for d in data_this_N["non_cm_points"]
+    }
+    check_rational_tier(catalogue_ds)
+    warm_isogeny_cache()
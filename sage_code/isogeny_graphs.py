@@ -26,15 +26,29 @@
 
 """
 
-from sage.all import EllipticCurve, Matrix, pari, gp
-from sage.interfaces.quit import expect_quitall
+from sage.all import QQ, EllipticCurve, Matrix, pari
 from utils import GENUS_ONE_LIST, GENUS_ZERO_LIST
 import logging
+import os
+import time
 
-from timeout import timeout, TimeoutError
+from gp_pool import OK as GP_OK, TIMEOUT as GP_TIMEOUT, gp_pool
+
+from deadline_executor import OK, run_jobs, run_with_deadline
+from isogeny_cache import isogeny_cache
+from targeted_isogenies import needing_class, reducible_primes, split_primes
+from twist_selection import small_models
 
 logger = logging.getLogger(__name__)
 ISOGENY_CLASS_TIMEOUT_S = 30
+# How many isogeny classes are computed at once; None for one per core
+NUM_ISOGENY_WORKERS = None
+# Whether to decide from the l-isogeny trees which non-CM j-invariants
+# need their full isogeny class (see `targeted_isogenies.py`)
+TARGETED_SEARCH = True
+
+# d -> dictionary j -> an isogeny class over Q(sqrt(d)) containing j
+_class_members = {}
 
 
 def isogeny_degrees(j, K=None):
@@ -46,68 +60,135 @@ def isogeny_degrees(j, K=None):
     return set(C.matrix()[C.index(E)])
 
 
+def _from_gp_result(K, curves, rows):
+    """The j-invariants and isogeny matrix from the result of a PARI worker"""
+
+    jInvs = [
+        EllipticCurve(
+            K, [K([QQ(num) / den for num, den in coeff]) for coeff in curve]
+        ).j_invariant()
+        for curve in curves
+    ]
+    return jInvs, Matrix(rows)
+
+
+def isogeny_classes_via_gp(js, K, d, models=None):
+    """The isogeny classes of the j-invariants in `js`, computed directly in
+    PARI, as PARI's library functions through Sage worked for some
+    j-invariants, but not for others. All of `js` go to the worker pool
+    in one request; see `gp_pool.py`. The curves sent are `models`, one
+    for each j, by default the small twists of `twist_selection.py`.
+    Failures give (None, None)."""
+
+    if models is None:
+        models = small_models(js, K)
+
+    output = []
+    logger.debug(f"Constructing isogeny graphs with j-invariants {js} ...")
+    results = gp_pool.isogeny_classes(
+        d, [[list(a) for a in E.a_invariants()] for E in models]
+    )
+    logger.debug("Done.")
+
+    for status, result in results:
+        if status == GP_OK:
+            logger.info("PARI/GP computation worked!! :)")
+            output.append(_from_gp_result(K, *result))
+            continue
+
+        if status == GP_TIMEOUT:
+            # now we really can't do anything more
+            logger.info("PARI/GP took too long; assuming no unrecorded isogenies "
+            "here, but you should check this directly in GP with the script in "
+            "the `gp_code` folder."
+            )
+        else:
+            # Again, if PARI/GP fails, then nothing more that can be done here
+            # except to ask the user to verify this directly in GP
+            logger.info(f"PARI/GP failed ({result}); assuming no unrecorded "
+            "isogenies here, but you should check this directly in GP with "
+            "the script in the `gp_code` folder."
+            )
+        output.append((None, None))
+
+    return output
+
+
 def isogeny_class_via_gp(j, K, d):
-    """The above function using the PARI C library functions worked for
-    some j-invariants, but not for others. I have no idea why?!? Anyway,
-    this function pacakges everything for computation directly in GP.
-    """
-    gp("default(parisize,256000000)");
-    gp(f"K = nfinit(a^2 - {d})");
-    j_as_list = list(K(j))
-    assert len(j_as_list) == 2
-    gp(f"myJ = Mod({j_as_list[0]} + {j_as_list[1]} * a, a ^ 2 - {d})");
-    gp("v = ellfromj(myJ)");
-    gp("E = ellinit(v, K)");
-    logger.debug(f"Constructing isogeny graph with j-invariant {j} ...")
-    L,M = gp("ellisomat(E, 1)");
+    return isogeny_classes_via_gp([j], K, d)[0]
+
+
+def _sage_isogeny_class(E, K):
+    # Sage would otherwise work out the reducible primes itself, with an
+    # isogeny computation for each prime allowed by its bound, and find a
+    # minimal model for each curve of the class, which only the
+    # j-invariants are needed of
+    C = E.isogeny_class(reducible_primes=reducible_primes(E, K), minimal_models=False)
+    return [F.j_invariant() for F in C] , C.matrix()
+
+
+def _sage_result(j, outcome):
+
+    if outcome.status == OK:
+        return outcome.value
+    logger.warning(f"Isogeny graph computation for {j} failed ({outcome.status}): "
+    f"{outcome.value}. We will attempt the same computation in PARI/GP ... "
+    )
+    return None, None
+
+
+def _sage_classes_and_seconds(js, K, num_workers, models=None):
+    """The classes as in `isogeny_classes_via_sage_only`, and the seconds
+    spent on each"""
+
+    if num_workers is None:
+        num_workers = NUM_ISOGENY_WORKERS or os.cpu_count()
+    if models is None:
+        models = small_models(js, K, num_workers)
+
+    # the split primes of K are computed once here, for all the children
+    split_primes(K)
+
+    logger.debug(f"Constructing isogeny graphs with j-invariants {js} ...")
+    jobs = [(i, _sage_isogeny_class, (E, K)) for i, E in enumerate(models)]
+    classes = [None] * len(js)
+    seconds = [None] * len(js)
+    for i, outcome in run_jobs(jobs, num_workers, ISOGENY_CLASS_TIMEOUT_S):
+        classes[i] = _sage_result(js[i], outcome)
+        seconds[i] = outcome.seconds
     logger.debug("Done.")
-    jInvs = [EllipticCurve(K, list(eRep)).j_invariant() for eRep in pari(L)]
-    M_matrix = Matrix(pari(M))
-    expect_quitall()
-    return jInvs, M_matrix
 
+    return classes, seconds
 
-@timeout(ISOGENY_CLASS_TIMEOUT_S)
-def attempt_gp_comp(j, K, d):
-    try:
-        L,M = isogeny_class_via_gp(j, K, d)
-        logger.info("PARI/GP computation worked!! :)")
-        return L, M
-    except TimeoutError:
-        # now we really can't do anything more
-        logger.info("PARI/GP took too long; assuming no unrecorded isogenies "
-        "here, but you should check this directly in GP with the script in "
-        "the `gp_code` folder."
-        )
-        return None, None
-    except Exception:
-        # Again, if PARI/GP fails, then nothing more that can be done here
-        # except to ask the user to verify this directly in GP
-        # because it's likely to be an issue with the Sage/GP interface 
-        logger.info("PARI/GP failed; assuming no unrecorded isogenies "
-        "here, but you should check this directly in GP with the script in "
-        "the `gp_code` folder."
-        )
-        return None, None
 
-@timeout(ISOGENY_CLASS_TIMEOUT_S)
-def timed_isogeny_class(E):
-    return E.isogeny_class()
+def isogeny_classes_via_sage_only(js, K, num_workers=None):
+    """The isogeny classes of the j-invariants in `js` via Sage, as a list
+    aligned with `js`, with (None, None) where that fails. Each is computed
+    in a child process which is killed at the deadline, `num_workers` at a
+    time (default `NUM_ISOGENY_WORKERS`); see `deadline_executor.py`. The
+    classes are those of the small twists of `twist_selection.py`."""
 
+    return _sage_classes_and_seconds(js, K, num_workers)[0]
 
-def isogeny_class_via_sage(j, K, d):
-    E = EllipticCurve(j=K(j))
+
+def isogeny_class_via_sage_only(j, K):
+    """The isogeny class via Sage, or (None, None) if that fails"""
     logger.debug(f"Constructing isogeny graph with j-invariant {j} ...")
-    try:
-        C = timed_isogeny_class(E)
-        logger.debug("Done.")
-        return [F.j_invariant() for F in C] , C.matrix()
-    except Exception as err_msg:
-        logger.warning(f"Isogeny graph computation failed with message: {err_msg}. "
-        "We will now attempt the same computation in PARI/GP ... "
-        )
-        L,M = attempt_gp_comp(j, K, d)
-        return L,M
+    outcome = run_with_deadline(
+        _sage_isogeny_class,
+        small_models([j], K)[0],
+        K,
+        deadline=ISOGENY_CLASS_TIMEOUT_S,
+    )
+    logger.debug("Done.")
+    return _sage_result(j, outcome)
+
+
+def isogeny_class_via_sage(j, K, d):
+    L,M = isogeny_class_via_sage_only(j, K)
+    if L is None:
+        L,M = isogeny_class_via_gp(j, K, d)
+    return L,M
 
 
 def isogeny_class_via_pari(j, K):
@@ -120,15 +201,177 @@ def isogeny_class_via_pari(j, K):
     return jInvs, Matrix(M)
 
 
-def unrecorded_isogenies(K, my_js, d, z=None, cm=False):
+def conjugate_class(jInvs, M):
+    """The isogeny class of the Galois conjugate of a curve over K, from its
+    own: the conjugate j-invariants, with the same isogeny degrees"""
+    if jInvs is None:
+        return None, None
+    return [j.galois_conjugate() for j in jInvs], M
+
+
+def _cached_class(K, d, j):
+    C = isogeny_cache.lookup(K, d, j)
+    if C is None:
+        C_conj = isogeny_cache.lookup(K, d, j.galois_conjugate())
+        if C_conj is not None:
+            C = conjugate_class(*C_conj)
+    return C
+
+
+def _compute_isogeny_classes(K, js, d, num_workers):
+    """Computes the classes via Sage, with those on which Sage fails all
+    going to PARI/GP together, and adds the successes to the cache with the
+    seconds spent on them. Both start from the small twists of
+    `twist_selection.py`."""
+
+    if num_workers is None:
+        num_workers = NUM_ISOGENY_WORKERS or os.cpu_count()
+
+    start = time.perf_counter()
+    models = small_models(js, K, num_workers)
+    twist_seconds = (time.perf_counter() - start) / len(js)
+    logger.info(f"d = {d}: small twists in {twist_seconds:.2f}s per curve")
+
+    classes, seconds = _sage_classes_and_seconds(js, K, num_workers, models)
+    gp_indices = [i for i, (jInvs, _) in enumerate(classes) if jInvs is None]
+    logger.info(
+        f"d = {d}: {len(js) - len(gp_indices)} of {len(js)} isogeny classes via "
+        f"Sage in {sum(seconds):.2f}s"
+    )
+    seconds = [s + twist_seconds for s in seconds]
+
+    if gp_indices:
+        gp_js = [js[i] for i in gp_indices]
+        start = time.perf_counter()
+        gp_classes = isogeny_classes_via_gp(
+            gp_js, K, d, [models[i] for i in gp_indices]
+        )
+        gp_seconds = time.perf_counter() - start
+        logger.info(
+            f"d = {d}: {sum(C[0] is not None for C in gp_classes)} of "
+            f"{len(gp_js)} isogeny classes via PARI/GP in {gp_seconds:.2f}s"
+        )
+        for i, gp_class in zip(gp_indices, gp_classes):
+            classes[i] = gp_class
+            seconds[i] += gp_seconds / len(gp_js)
+
+    for j, (jInvs, M), j_seconds in zip(js, classes, seconds):
+        if jInvs is not None:
+            isogeny_cache.record(K, d, j, jInvs, M, j_seconds)
+
+    return classes
+
+
+def _isogeny_classes_of_representatives(K, js, d, num_workers):
+    """The classes of `js`, none of which are conjugate. A j lying in a
+    class already known for this d gets that class: for j other than 0 and
+    1728, E(j) is a quadratic twist of the curve of the class with that
+    j-invariant, so its class has the same j-invariants and degrees. The
+    rest are computed a wave of `num_workers` at a time, so that the
+    classes of a wave spare the later waves."""
+
+    if num_workers is None:
+        num_workers = NUM_ISOGENY_WORKERS or os.cpu_count()
+    members = _class_members.setdefault(int(d), {})
+
+    def remember(C):
+        for j in C[0]:
+            members.setdefault(j, C)
+
+    def known_class(j):
+        if j in (0, 1728):
+            return None
+        return members.get(j)
+
+    classes = [None] * len(js)
+    for i, j in enumerate(js):
+        classes[i] = known_class(j) or _cached_class(K, d, j)
+        if classes[i] is not None:
+            remember(classes[i])
+
+    todo = [i for i, C in enumerate(classes) if C is None]
+    while todo:
+        wave, todo = todo[:num_workers], todo[num_workers:]
+        computed = _compute_isogeny_classes(K, [js[i] for i in wave], d, num_workers)
+        for i, C in zip(wave, computed):
+            classes[i] = C
+            if C[0] is not None:
+                remember(C)
+
+        still_todo = []
+        for i in todo:
+            classes[i] = known_class(js[i])
+            if classes[i] is None:
+                still_todo.append(i)
+        todo = still_todo
+
+    return classes
+
+
+def isogeny_classes(K, js, d, num_workers=None):
+    """The isogeny classes of the j-invariants in `js`, as a list aligned
+    with `js`, with (None, None) for failures. Of a j-invariant and its
+    Galois conjugate only one class is computed, and the other is its
+    conjugate, and a j already in a known class for this d is not computed
+    again. Classes are read from the isogeny cache where possible; the
+    others are computed via Sage, with those on which Sage fails all going
+    to PARI/GP together, and the successes are added to the cache."""
+
+    js = [K(j) for j in js]
+
+    # for each j, the index of the j whose class is computed, and whether
+    # j is its conjugate
+    sources = []
+    representative = {}
+    for i, j in enumerate(js):
+        if j in representative:
+            sources.append((representative[j], False))
+        elif j.galois_conjugate() in representative:
+            sources.append((representative[j.galois_conjugate()], True))
+        else:
+            representative[j] = i
+            sources.append((i, False))
+
+    rep_indices = sorted(representative.values())
+    rep_classes = dict(
+        zip(
+            rep_indices,
+            _isogeny_classes_of_representatives(
+                K, [js[i] for i in rep_indices], d, num_workers
+            ),
+        )
+    )
+
+    return [
+        conjugate_class(*rep_classes[i]) if is_conjugate else rep_classes[i]
+        for i, is_conjugate in sources
+    ]
+
+
+def unrecorded_isogenies(K, my_js, d, z=None, cm=False, num_workers=None):
     """This is a wrapper for the above function, to obtain the "unrecorded isogenies"
-    (in the sense of Mazur) from the j-invariants identified above"""
+    (in the sense of Mazur) from the j-invariants identified above. The
+    isogeny classes are computed `num_workers` at a time (default
+    `NUM_ISOGENY_WORKERS`). Without CM, only the j-invariants which may
+    have an isogeny of degree a with z | a and a > z get their class
+    computed, if `TARGETED_SEARCH`."""
 
     isog_classes_j_invs = []
     isog_mats = []
     failed_dict = {}
-    for j in my_js:
-        jInvs, M = isogeny_class_via_sage(j, K, d)
+
+    if num_workers is None:
+        num_workers = NUM_ISOGENY_WORKERS or os.cpu_count()
+
+    if not cm and TARGETED_SEARCH:
+        assert z is not None
+        needed = needing_class(K, my_js, z, num_workers)
+        logger.info(f"{len(needed)} of {len(my_js)} j-invariants need their class")
+        my_js = [j for j in my_js if j in needed]
+
+    classes = isogeny_classes(K, my_js, d, num_workers)
+
+    for j, (jInvs, M) in zip(my_js, classes):
         if jInvs is not None:
             isog_classes_j_invs.append(jInvs)
             isog_mats.append(M)
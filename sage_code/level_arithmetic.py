@@ -0,0 +1,266 @@
+"""level_arithmetic.py
+
+    Arithmetic data of the plus and minus parts J_0(p)^+ and J_0(p)^- of
+    J_0(p) needed by the torsion tests: the numbers of points over F_q and
+    F_{q^2} for small primes q, and the order of the rational torsion of
+    J_0(p).
+
+    These used to go through the abelian variety of the sign part: its
+    Frobenius polynomial P at q, the companion matrix of P, and the
+    characteristic polynomials of that matrix and of its square. Here
+    instead P comes straight from the characteristic polynomial h of the
+    Hecke operator T_q on the sign part of the modular symbols:
+
+        P(x) = x^g h(x + q/x),   so   #A(F_q) = P(1) = h(q + 1),
+
+    where g is the dimension. The Frobenius polynomial P_2 over F_{q^2},
+    whose roots are the squares of those of P, is the Graeffe transform of
+    P, i.e. P_2(x^2) = P(x) P(-x), so #A(F_{q^2}) = P_2(1) = P(1) P(-1).
+    Everything after the Hecke polynomial is integer arithmetic.
+
+    The point counts and torsion orders are kept in a JSON file, per level,
+    so each is only computed once. Running this file compares the two ways
+    of computing the point counts at every level the solver uses, and times
+    them.
+
+    ====================================================================
+
+    This file is part of Quadratic Kenku Solver.
+
+    Copyright (C) 2022 Barinder S. Banwait, Filip Najman, and Oana
+    Padurariu
+
+    Quadratic Kenku Solver is free software: you can redistribute it
+    and/or modify it under the terms of the GNU General Public License
+    as published by the Free Software Foundation, either version 3 of
+    the License, or any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+    ====================================================================
+
+"""
+
+import json
+import os
+import time
+from math import comb, gcd
+
+from sage.all import J0, ZZ, companion_matrix
+
+from modsym_cache import sign_part
+from sieves import primes_up_to
+
+LEVEL_ARITHMETIC_PATH = "cache/level_arithmetic.json"
+
+
+def _evaluate(coeffs, x):
+    """The value at x of the polynomial with coefficients `coeffs`, lowest
+    degree first"""
+
+    value = 0
+    for c in reversed(coeffs):
+        value = value * x + c
+    return value
+
+
+def monic_square_root(coeffs):
+    """The coefficients of the monic polynomial whose square has
+    coefficients `coeffs` (lowest degree first)"""
+
+    n = len(coeffs) - 1
+    assert n % 2 == 0 and coeffs[-1] == 1, "not the square of a monic polynomial"
+    g = n // 2
+
+    # fix the coefficients of the root from the top down, matching those
+    # of the square from degree n - 1 down to degree g
+    root = [0] * g + [1]
+    for k in range(g - 1, -1, -1):
+        known = sum(root[i] * root[g + k - i] for i in range(k + 1, g))
+        root[k] = (coeffs[g + k] - known) // 2
+
+    assert _multiply(root, root) == list(coeffs), "not a square"
+    return root
+
+
+def _multiply(f, g):
+
+    output = [0] * (len(f) + len(g) - 1)
+    for i, a in enumerate(f):
+        for j, b in enumerate(g):
+            output[i + j] += a * b
+    return output
+
+
+def frobenius_polynomial(hecke_coeffs, q):
+    """The coefficients of P(x) = x^g h(x + q/x), for h of degree g with
+    coefficients `hecke_coeffs`"""
+
+    g = len(hecke_coeffs) - 1
+    output = [0] * (2 * g + 1)
+
+    # x^g (x + q/x)^k = x^(g - k) (x^2 + q)^k
+    for k, c in enumerate(hecke_coeffs):
+        for i in range(k + 1):
+            output[g - k + 2 * i] += c * comb(k, i) * q ** (k - i)
+
+    return output
+
+
+def graeffe(coeffs):
+    """The coefficients of the polynomial P_2 whose roots are the squares of
+    those of P, for P of even degree: P_2(x^2) = P(x) P(-x)"""
+
+    assert len(coeffs) % 2 == 1, "P should have even degree"
+    negated = [c if i % 2 == 0 else -c for i, c in enumerate(coeffs)]
+    return _multiply(coeffs, negated)[::2]
+
+
+def point_counts_from_hecke(hecke_coeffs, q):
+    """(#A(F_q), #A(F_{q^2})) for the abelian variety A whose T_q has
+    characteristic polynomial with coefficients `hecke_coeffs`"""
+
+    frob_pol = frobenius_polynomial(hecke_coeffs, q)
+    return _evaluate(frob_pol, 1), _evaluate(graeffe(frob_pol), 1)
+
+
+def hecke_polynomial_coefficients(p, sign, q):
+    """The coefficients of the characteristic polynomial of T_q on the plus
+    (sign = 1) or minus (sign = -1) part of J_0(p). The modular symbols
+    have sign 0, so carry each eigenform twice, and their Hecke polynomial
+    is the square of the one wanted."""
+
+    S_sign = sign_part(p, sign)["sign_part"]
+    return monic_square_root([int(ZZ(c)) for c in S_sign.hecke_polynomial(q).list()])
+
+
+def point_counts(p, sign, q):
+    """(#A(F_q), #A(F_{q^2})) for A the plus or minus part of J_0(p)"""
+
+    return point_counts_from_hecke(hecke_polynomial_coefficients(p, sign, q), q)
+
+
+class LevelArithmetic:
+    """The point counts and torsion orders, read from and added to the file
+    at `path`"""
+
+    def __init__(self, path=LEVEL_ARITHMETIC_PATH):
+        self.path = path
+        self._entries = None
+
+    def _read_file(self):
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, "r") as arithmetic_file:
+            return json.load(arithmetic_file)
+
+    def _write_file(self):
+        # merge with what other processes may have added meanwhile
+        all_entries = self._read_file()
+        for p, entry in self._entries.items():
+            old_entry = all_entries.setdefault(p, {})
+            for key, value in entry.items():
+                if isinstance(value, dict):
+                    old_entry.setdefault(key, {}).update(value)
+                else:
+                    old_entry[key] = value
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp{os.getpid()}"
+        with open(tmp_path, "w") as arithmetic_file:
+            json.dump(all_entries, arithmetic_file, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+    def _entry(self, p):
+        if self._entries is None:
+            self._entries = self._read_file()
+        return self._entries.setdefault(str(p), {})
+
+    def frobenius_point_counts(self, p, sign, B):
+        """The primes 5 <= q < B not dividing p, together with the numbers
+        of points of the plus or minus part of J_0(p) over F_q and over
+        F_{q^2} at each of them, as three tuples"""
+
+        counts = self._entry(p).setdefault(str(sign), {})
+        primes = [q for q in primes_up_to(B - 1) if q >= 5 and gcd(q, p) == 1]
+
+        missing = [q for q in primes if str(q) not in counts]
+        for q in missing:
+            counts[str(q)] = list(point_counts(p, sign, q))
+        if missing:
+            self._write_file()
+
+        return (
+            tuple(primes),
+            tuple(counts[str(q)][0] for q in primes),
+            tuple(counts[str(q)][1] for q in primes),
+        )
+
+    def rational_torsion_order(self, p):
+        """The order of J_0(p)(Q)_tors"""
+
+        entry = self._entry(p)
+        if "torsion_order" not in entry:
+            entry["torsion_order"] = int(J0(p).rational_torsion_order(proof=False))
+            self._write_file()
+        return entry["torsion_order"]
+
+
+level_arithmetic = LevelArithmetic()
+
+
+def _point_counts_via_abelian_variety(p, sign, q):
+    """The point counts as they were computed before, for comparison"""
+
+    J_sign = sign_part(p, sign)["sign_part"].abelian_variety()
+    frob_mat = companion_matrix(J_sign.frobenius_polynomial(q))
+    return int(frob_mat.charpoly()(1)), int((frob_mat**2).charpoly()(1))
+
+
+def benchmark(levels, B=100):
+    """Checks that both ways of computing the point counts agree at each p
+    in `levels`, and prints the time each takes per level. Where the old
+    way fails (it may at composite levels), that is printed instead of the
+    comparison."""
+
+    for p in sorted(levels):
+        primes = [q for q in primes_up_to(B - 1) if q >= 5 and gcd(q, p) == 1]
+        for sign in (1, -1):
+            # build the modular symbols first, which both ways need
+            sign_part(p, sign)
+
+            start = time.perf_counter()
+            new_counts = [point_counts(p, sign, q) for q in primes]
+            new_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            try:
+                old_counts = [
+                    _point_counts_via_abelian_variety(p, sign, q) for q in primes
+                ]
+            except Exception as err_msg:
+                print(
+                    f"p = {p:>4}, sign = {sign:>2}: abelian variety failed "
+                    f"({err_msg!r}), Hecke {new_time:8.3f}s"
+                )
+                continue
+            old_time = time.perf_counter() - start
+
+            assert old_counts == new_counts, f"point counts differ at {p}, {sign}"
+            print(
+                f"p = {p:>4}, sign = {sign:>2}: abelian variety {old_time:8.3f}s, "
+                f"Hecke {new_time:8.3f}s, speedup {old_time / new_time:6.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    from utils import AMF2, HYPERELLIPTIC_VALUES, qdpts_dat
+
+    # the levels at which the solver runs the Mordell-Weil checks
+    solver_levels = AMF2 | HYPERELLIPTIC_VALUES | {int(N) for N in qdpts_dat} | {163}
+    benchmark(solver_levels)
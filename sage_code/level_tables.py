@@ -0,0 +1,344 @@
+"""level_tables.py
+
+    Tables of the genera attached to each level N up to a bound: the genus
+    of X_0(N), the genera of its quotients by the Atkin-Lehner involutions
+    w_N' (N' a Hall divisor of N), and, for primes p, the genera of the
+    split and nonsplit Cartan curves X_s^+(p) and X_ns^+(p).
+
+    The genus of X_0(N) comes from the usual formula in terms of the
+    factorisation of N, and the quotient genera from the Riemann-Hurwitz
+    formula and the number of fixed points of w_N', which is a product of
+    local factors and class numbers (Furumoto-Hasegawa). All factorisations
+    are read off a smallest prime factor sieve, and the class numbers come
+    from PARI, computed once each. The tables are written to a JSON file,
+    indexed by N, so that later runs only read them.
+
+    ====================================================================
+
+    This file is part of Quadratic Kenku Solver.
+
+    Copyright (C) 2022 Barinder S. Banwait, Filip Najman, and Oana
+    Padurariu
+
+    Quadratic Kenku Solver is free software: you can redistribute it
+    and/or modify it under the terms of the GNU General Public License
+    as published by the Free Software Foundation, either version 3 of
+    the License, or any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+    ====================================================================
+
+"""
+
+import json
+import os
+from fractions import Fraction
+from functools import lru_cache
+from itertools import product
+from math import gcd, prod
+
+from sage.all import kronecker_symbol, pari
+
+from sieves import factor_with_spf, prime_divisors, smallest_prime_factors
+
+LEVEL_TABLES_PATH = "level_tables.json"
+LEVEL_TABLE_BOUND = 1000
+
+# X_0(N) is hyperelliptic exactly when it has genus at least 2 and either
+# some w_N' is a hyperelliptic involution, i.e. X_0(N)/w_N' has genus zero,
+# or N is one of these (Ogg)
+NON_ATKIN_LEHNER_HYPERELLIPTIC = {37, 40, 48}
+
+GENUS_ZERO = "genus zero"
+ELLIPTIC = "elliptic"
+HYPERELLIPTIC = "hyperelliptic"
+NON_HYPERELLIPTIC = "non-hyperelliptic"
+
+_SPF = smallest_prime_factors(LEVEL_TABLE_BOUND)
+
+
+def factorisation(n):
+    """Dictionary p -> exponent for the positive integer n"""
+
+    if n < len(_SPF):
+        return factor_with_spf(n, _SPF)
+
+    output = {}
+    for p in prime_divisors(n):
+        output[p] = 0
+        while n % p == 0:
+            n //= p
+            output[p] += 1
+    return output
+
+
+@lru_cache(maxsize=None)
+def class_number(D):
+    """The class number of the imaginary quadratic order of discriminant D"""
+
+    return int(pari(D).qfbclassno())
+
+
+def gamma0_genus(N):
+    """The genus of X_0(N), from the index of Gamma_0(N) and its numbers of
+    elliptic points and cusps"""
+
+    fac = factorisation(N)
+
+    index = prod(p ** (e - 1) * (p + 1) for p, e in fac.items())
+    if N % 4 == 0:
+        nu_2 = 0
+    else:
+        nu_2 = prod(1 + kronecker_symbol(-4, p) for p in fac)
+    if N % 9 == 0:
+        nu_3 = 0
+    else:
+        nu_3 = prod(1 + kronecker_symbol(-3, p) for p in fac)
+    cusps = prod(
+        sum(_euler_phi_prime_power(p, min(i, e - i)) for i in range(e + 1))
+        for p, e in fac.items()
+    )
+
+    genus = (
+        1
+        + Fraction(index, 12)
+        - Fraction(nu_2, 4)
+        - Fraction(nu_3, 3)
+        - Fraction(cusps, 2)
+    )
+    return _integral(genus)
+
+
+def _euler_phi_prime_power(p, k):
+    return 1 if k == 0 else p ** (k - 1) * (p - 1)
+
+
+def split_cartan_genus(p):
+    """Computes the genus of X_s^+(p) from Imin Chen's "The Jacobians of
+    non-split Cartan modular curves"""
+
+    return Fraction(p**2 - 8 * p + 11 - 4 * kronecker_symbol(-3, p), 24)
+
+
+def nonsplit_cartan_genus(p):
+    """Computes the genus of X_ns^+(p) from Imin Chen's "The Jacobians of
+    non-split Cartan modular curves"""
+
+    return Fraction(
+        p**2 - 10 * p + 23 + 6 * kronecker_symbol(-1, p) + 4 * kronecker_symbol(-3, p),
+        24,
+    )
+
+
+def is_atkin_lehner_divisor(d, N):
+
+    if N % d == 0:
+        if gcd(d, N // d) == 1:
+            return True
+    return False
+
+
+def atkin_lehner_divisors(N):
+    """The Hall divisors N' > 1 of N, in increasing order"""
+
+    prime_powers = [p**e for p, e in factorisation(N).items()]
+    return sorted(
+        prod(choice)
+        for choice in product(*[(1, q) for q in prime_powers])
+        if prod(choice) > 1
+    )
+
+
+def c_i_at_2(i, Ndash, N):
+
+    if i == 1:
+        if Ndash % 4 == 1:
+            if is_atkin_lehner_divisor(2, N):
+                return 1
+            elif N % 4 == 0:
+                return 0
+        if Ndash % 4 == 3:
+            if is_atkin_lehner_divisor(2, N):
+                return 2
+            elif N % 8 == 0:
+                return 3 * (1 + kronecker_symbol(-Ndash, 2))
+            elif N % 4 == 0:
+                return 3 + kronecker_symbol(-Ndash, 2)
+
+    if i == 2 and Ndash % 4 == 3:
+        return 1 + kronecker_symbol(-Ndash, 2)
+
+
+def c_i(i, p, Ndash, N):
+
+    if p == 2:
+        return c_i_at_2(i, Ndash, N)
+
+    if Ndash % 4 == 3:
+        return 1 + kronecker_symbol(-Ndash, p)
+
+    else:
+        return 1 + kronecker_symbol(-4 * Ndash, p)
+
+
+def fixed_point_number(Ndash, N):
+
+    assert is_atkin_lehner_divisor(Ndash, N), "Ndash does not give an AL involution"
+
+    N_over_Ndash = N // Ndash
+
+    base_contribution = prod(
+        [c_i(1, p, Ndash, N) for p in factorisation(N_over_Ndash)]
+    ) * class_number(-4 * Ndash)
+
+    if Ndash == 2:
+        other_contribution = prod(
+            [1 + kronecker_symbol(-4, p) for p in factorisation(N // 2)]
+        )
+    elif Ndash == 3:
+        other_contribution = prod(
+            [1 + kronecker_symbol(-3, p) for p in factorisation(N // 3)]
+        )
+    elif Ndash == 4:
+        # the prime powers exactly dividing N/4
+        other_contribution = prod(
+            [
+                p ** (nu // 2) + p ** ((nu - 1) // 2)
+                for p, nu in factorisation(N // 4).items()
+            ]
+        )
+    elif Ndash % 4 == 3:
+        other_contribution = prod(
+            [c_i(2, p, Ndash, N) for p in factorisation(N_over_Ndash)]
+        ) * class_number(-Ndash)
+    else:
+        other_contribution = 0
+
+    return base_contribution + other_contribution
+
+
+def _quotient_genus(N, Ndash, genus):
+
+    return Fraction(2 * genus + 2 - fixed_point_number(Ndash, N), 4)
+
+
+def _integral(x):
+
+    assert x.denominator == 1, f"{x} should be an integer"
+    return int(x)
+
+
+def build_level_tables(bound=LEVEL_TABLE_BOUND):
+    """The tables described at the top of this file, for all N <= bound.
+    Lists are indexed by N; the Cartan genera are only for primes p >= 5,
+    where the formulas above apply."""
+
+    spf = smallest_prime_factors(bound)
+    genera = [None]
+    quotient_genera = [None]
+    cartan_genera = {}
+
+    for N in range(1, bound + 1):
+        genus = gamma0_genus(N)
+        genera.append(genus)
+        quotient_genera.append(
+            {
+                str(Ndash): _integral(_quotient_genus(N, Ndash, genus))
+                for Ndash in atkin_lehner_divisors(N)
+            }
+        )
+        if N >= 5 and spf[N] == N:
+            cartan_genera[str(N)] = [
+                _integral(split_cartan_genus(N)),
+                _integral(nonsplit_cartan_genus(N)),
+            ]
+
+    return {
+        "bound": bound,
+        "genus": genera,
+        "quotient_genera": quotient_genera,
+        "cartan_genera": cartan_genera,
+    }
+
+
+_LEVEL_TABLES = None
+
+
+def level_tables(path=LEVEL_TABLES_PATH, bound=LEVEL_TABLE_BOUND):
+    """The tables, read from `path`; they are (re)built and written there
+    first if the file is missing or covers fewer levels than `bound`"""
+
+    global _LEVEL_TABLES
+
+    if _LEVEL_TABLES is not None and _LEVEL_TABLES["bound"] >= bound:
+        return _LEVEL_TABLES
+
+    tables = None
+    if os.path.exists(path):
+        with open(path, "r") as tables_file:
+            tables = json.load(tables_file)
+    if tables is None or tables["bound"] < bound:
+        tables = build_level_tables(bound)
+        tmp_path = f"{path}.tmp{os.getpid()}"
+        with open(tmp_path, "w") as tables_file:
+            json.dump(tables, tables_file)
+        os.replace(tmp_path, path)
+
+    _LEVEL_TABLES = tables
+    return tables
+
+
+def genus_of_X0(N):
+    """The genus of X_0(N), from the tables when N is within their bound"""
+
+    tables = level_tables()
+    if N <= tables["bound"]:
+        return tables["genus"][N]
+    return gamma0_genus(N)
+
+
+def quotient_genera(N):
+    """Dictionary N' -> genus of X_0(N)/w_N', for the Hall divisors N' > 1"""
+
+    tables = level_tables()
+    if N <= tables["bound"]:
+        return {int(Ndash): g for Ndash, g in tables["quotient_genera"][N].items()}
+    genus = gamma0_genus(N)
+    return {
+        Ndash: _integral(_quotient_genus(N, Ndash, genus))
+        for Ndash in atkin_lehner_divisors(N)
+    }
+
+
+def genus_of_quotient(N, Ndash):
+
+    try:
+        return quotient_genera(N)[Ndash]
+    except KeyError:
+        # not a Hall divisor; fixed_point_number says so
+        return _quotient_genus(N, Ndash, genus_of_X0(N))
+
+
+def classify_level(N):
+    """Whether X_0(N) has genus zero, is elliptic, hyperelliptic or neither"""
+
+    genus = genus_of_X0(N)
+    if genus == 0:
+        return GENUS_ZERO
+    if genus == 1:
+        return ELLIPTIC
+    if N in NON_ATKIN_LEHNER_HYPERELLIPTIC or 0 in quotient_genera(N).values():
+        return HYPERELLIPTIC
+    return NON_HYPERELLIPTIC
+
+
+if __name__ == "__main__":
+    tables = level_tables()
+    print(f"Level tables up to {tables['bound']} are in {LEVEL_TABLES_PATH}")
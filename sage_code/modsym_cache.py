@@ -0,0 +1,185 @@
+"""modsym_cache.py
+
+    A cache of the modular symbol spaces used in the Mordell-Weil checks:
+    for a level N, an Atkin-Lehner sign and a base ring, the ambient space
+    ModularSymbols(N, base_ring=...), the kernel of w_N - sign on its
+    cuspidal subspace, and the decomposition of that kernel.
+
+    There are two tiers. Within a process, the spaces are kept in a least
+    recently used cache whose total size (measured as the size of the
+    pickled entries) is kept below a ceiling, evicting the oldest entries
+    first. Behind it is a directory of pickled entries, one file per key,
+    which persists between runs and is shared by worker processes. Run this
+    file directly to fill the directory for all the levels we use:
+
+        sage -python modsym_cache.py
+
+    ====================================================================
+
+    This file is part of Quadratic Kenku Solver.
+
+    Copyright (C) 2022 Barinder S. Banwait, Filip Najman, and Oana
+    Padurariu
+
+    Quadratic Kenku Solver is free software: you can redistribute it
+    and/or modify it under the terms of the GNU General Public License
+    as published by the Free Software Foundation, either version 3 of
+    the License, or any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+    ====================================================================
+
+"""
+
+import hashlib
+import logging
+import os
+from collections import OrderedDict
+
+from sage.all import QQ, ModularSymbols, dumps, loads, parent
+
+logger = logging.getLogger(__name__)
+
+MODSYM_CACHE_DIR = "cache/modsym"
+# Ceiling on the in-process tier, in bytes of pickled entries
+MODSYM_CACHE_MAX_BYTES = 256 * 2**20
+
+
+def _ring_tag(base_ring):
+    """A short file name friendly tag for a base ring"""
+
+    if base_ring == QQ:
+        return "QQ"
+    return hashlib.sha1(str(base_ring).encode()).hexdigest()[:12]
+
+
+def build_sign_part(N, sign, base_ring=QQ):
+    """Dictionary with the ambient space of modular symbols of level N over
+    `base_ring`, the kernel of w_N - sign on its cuspidal subspace, and the
+    decomposition of that kernel"""
+
+    ML = ModularSymbols(N, base_ring=base_ring)
+    SL = ML.cuspidal_subspace()
+    TL = SL.atkin_lehner_operator()
+    S_sign = (TL - sign * parent(TL)(1)).kernel()
+
+    return {
+        "ambient": ML,
+        "sign_part": S_sign,
+        "decomposition": list(S_sign.decomposition()),
+    }
+
+
+class ModularSymbolsCache:
+    """Two tier cache of `build_sign_part`, keyed by (N, sign, base ring).
+    `max_bytes` bounds the in-process tier; `cache_dir` (None for no disk
+    tier) holds the on-disk one."""
+
+    def __init__(self, cache_dir=MODSYM_CACHE_DIR, max_bytes=MODSYM_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+        self.hits = {"memory": 0, "disk": 0, "built": 0}
+
+    def _path(self, N, sign, base_ring):
+        sign_name = "plus" if sign == 1 else "minus"
+        return os.path.join(
+            self.cache_dir, f"{N}_{sign_name}_{_ring_tag(base_ring)}.sobj"
+        )
+
+    def _load(self, path):
+        try:
+            with open(path, "rb") as sobj_file:
+                return loads(sobj_file.read())
+        except FileNotFoundError:
+            return None
+        except Exception as err_msg:
+            # a file from an older Sage may not unpickle; rebuild it
+            logger.warning(f"Ignoring unreadable cache file {path}: {err_msg}")
+            return None
+
+    def _store(self, path, data):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = f"{path}.tmp{os.getpid()}"
+        with open(tmp_path, "wb") as sobj_file:
+            sobj_file.write(data)
+        os.replace(tmp_path, path)
+
+    def _remember(self, key, entry, size):
+        self._entries[key] = (entry, size)
+        self._total_bytes += size
+        # evict the least recently used entries, but always keep this one
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            old_key, (_, old_size) = self._entries.popitem(last=False)
+            self._total_bytes -= old_size
+            logger.debug(f"Evicted {old_key} from the modular symbols cache")
+
+    def get(self, N, sign, base_ring=QQ):
+        """The output of `build_sign_part(N, sign, base_ring)`, from the
+        first tier which has it"""
+
+        N, sign = int(N), int(sign)
+        key = (N, sign, str(base_ring))
+
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self.hits["memory"] += 1
+            return self._entries[key][0]
+
+        path = None if self.cache_dir is None else self._path(N, sign, base_ring)
+        entry = None if path is None else self._load(path)
+
+        if entry is not None:
+            self.hits["disk"] += 1
+            data = None
+        else:
+            self.hits["built"] += 1
+            entry = build_sign_part(N, sign, base_ring)
+            data = dumps(entry)
+            if path is not None:
+                self._store(path, data)
+
+        size = len(data) if data is not None else os.path.getsize(path)
+        self._remember(key, entry, size)
+        return entry
+
+    def clear(self):
+        """Empties the in-process tier"""
+        self._entries.clear()
+        self._total_bytes = 0
+
+
+modsym_cache = ModularSymbolsCache()
+
+
+def sign_part(N, sign, base_ring=QQ):
+    """Shorthand for `modsym_cache.get`"""
+
+    return modsym_cache.get(N, sign, base_ring)
+
+
+def warm_start(levels, signs=(1, -1)):
+    """Makes sure the disk tier has every level in `levels`, for both signs"""
+
+    for N in sorted(levels):
+        for sign in signs:
+            logger.info(f"Building level {N}, sign {sign}")
+            modsym_cache.get(N, sign)
+            # no need to keep them all in this process
+            modsym_cache.clear()
+
+
+if __name__ == "__main__":
+    from utils import AMF2, HYPERELLIPTIC_VALUES, qdpts_dat
+
+    logging.basicConfig(level=logging.INFO)
+    warm_start(AMF2 | HYPERELLIPTIC_VALUES | {int(N) for N in qdpts_dat})
+    print(f"Modular symbols cache: {modsym_cache.hits}")
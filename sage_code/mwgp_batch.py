@@ -0,0 +1,310 @@
+"""mwgp_batch.py
+
+    Batched versions of the checks in Proposition 4.1 that the Mordell-Weil
+    group of J_0(p)^+ or J_0(p)^- does not grow from Q to Q(sqrt(d)), for
+    many d at a fixed level p.
+
+    The torsion test for a single d computes, for each small prime q, the
+    Frobenius polynomial of the plus or minus part at q and the number of
+    points over F_q or F_{q^2}, according as q splits in Q(sqrt(d)) or not.
+    None of that depends on d except the choice between the two counts. So
+    here both counts are computed once per level and kept (see
+    `level_arithmetic.py`), and the test for a whole list of d becomes a
+    table of Kronecker symbols chi_d(q), a selection of one count per
+    (d, q) and a gcd per d.
+
+    Likewise for the rank test: for quadratic chi the modular symbols are
+    over QQ, so the space, the Atkin-Lehner kernel, its decomposition and
+    the rational period mappings are built once per level, together with
+    the image under each period mapping of every Manin symbol. The twisted
+    winding element of chi_d is, up to sign,
+
+        sum over a mod m coprime to m of chi_d(a) {0, a/m},   m = |D|,
+
+    and {0, a/m} is the sum of the Manin symbols (q_k, +-q_{k-1}) read off
+    the convergents of a/m. So its image is an integer combination of the
+    stored images: per d we only count how often each Manin symbol occurs,
+    weighted by chi_d(a), and multiply by the image matrix. The convergents
+    of a/m do not depend on the level, and a small cache of the latest
+    moduli shares them between levels for the one-d-at-a-time checks of
+    the solver and for small batches; larger batches compute them afresh
+    rather than evict it. The sign of the twisted winding element does not
+    matter, since only whether its image vanishes is used.
+
+    ====================================================================
+
+    This file is part of Quadratic Kenku Solver.
+
+    Copyright (C) 2022 Barinder S. Banwait, Filip Najman, and Oana
+    Padurariu
+
+    Quadratic Kenku Solver is free software: you can redistribute it
+    and/or modify it under the terms of the GNU General Public License
+    as published by the Free Software Foundation, either version 3 of
+    the License, or any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+    ====================================================================
+
+"""
+
+import time
+from functools import lru_cache, reduce
+from math import gcd
+
+import numpy as np
+from sage.all import QQ, ZZ, matrix, oo
+
+from character_tables import kronecker_table, kronecker_values
+from level_arithmetic import level_arithmetic
+from modsym_cache import sign_part
+from verdict_store import verdict_store
+
+PLUS = 1
+MINUS = -1
+
+# The bound on the primes q used by the torsion tests of each sign
+TORSION_BOUND = {PLUS: 100, MINUS: 30}
+
+
+def frobenius_point_counts(p, sign, B):
+    """The primes 5 <= q < B not dividing p, together with the numbers of
+    points of the plus or minus part of J_0(p) over F_q and over F_{q^2}
+    at each of them, as three tuples; see `level_arithmetic.py`"""
+
+    return level_arithmetic.frobenius_point_counts(p, sign, B)
+
+
+def rational_torsion_order(p):
+    """The order of J_0(p)(Q)_tors"""
+
+    return level_arithmetic.rational_torsion_order(p)
+
+
+def torsion_target(p, sign):
+    """What the gcd of the point counts must be for no torsion growth. By a
+    theorem of Mazur, the rational torsion of J_0(p) lies entirely in the
+    minus part."""
+
+    return 1 if sign == PLUS else rational_torsion_order(p)
+
+
+def batch_is_torsion_same(p, d_vals, sign, B=None):
+    """Dictionary d -> whether the plus (sign = 1) or minus (sign = -1) part
+    of J_0(p) gains no new torsion over Q(sqrt(d)), for each d in `d_vals`.
+    Agrees with `is_torsion_same_plus` and `is_torsion_same_minus`."""
+
+    if B is None:
+        B = TORSION_BOUND[sign]
+
+    primes, counts_over_q, counts_over_q_sq = frobenius_point_counts(p, sign, B)
+    target = torsion_target(p, sign)
+
+    chi = kronecker_table(d_vals, primes)
+    # a 1 in row d marks the primes split in Q(sqrt(d)); d values with the
+    # same split primes share their gcd
+    split_rows = chi == 1
+    verdict_of_row = {}
+    output = {}
+
+    for d, split in zip(d_vals, split_rows):
+        key = split.tobytes()
+        if key not in verdict_of_row:
+            counts = np.where(
+                split,
+                np.array(counts_over_q, dtype=object),
+                np.array(counts_over_q_sq, dtype=object),
+            )
+            verdict_of_row[key] = reduce(gcd, counts, 0) == target
+        output[d] = verdict_of_row[key]
+
+    return output
+
+
+def _convergent_denominators(a, m):
+    """The denominators q_0, q_1, ... of the convergents of a/m"""
+
+    denominators = []
+    q_prev, q = 1, 0
+    while m:
+        t, r = divmod(a, m)
+        q_prev, q = q, t * q + q_prev
+        denominators.append(q)
+        a, m = m, r
+    return denominators
+
+
+def winding_fraction_symbols(m):
+    """The Manin symbols (u, v) making up {0, a/m}, for all 0 < a < m
+    coprime to m, as three int64 arrays: a, u and v (one entry per symbol).
+    This follows Sage's `_modular_symbol_0_to_alpha` in weight 2: for k >= 1
+    the k-th symbol is (q_k, q_{k-1}), with q_{k-1} negated for even k."""
+
+    a_list, u_list, v_list = [], [], []
+
+    for a in range(1, m):
+        if gcd(a, m) != 1:
+            continue
+        denominators = _convergent_denominators(a, m)
+        for k in range(1, len(denominators)):
+            v = denominators[k - 1]
+            a_list.append(a)
+            u_list.append(denominators[k])
+            v_list.append(-v if k % 2 == 0 else v)
+
+    return (
+        np.array(a_list, dtype=np.int64),
+        np.array(u_list, dtype=np.int64),
+        np.array(v_list, dtype=np.int64),
+    )
+
+
+# For the checks of the same few d at several levels in a row
+WINDING_CACHE_SIZE = 64
+_recent_winding_fraction_symbols = lru_cache(maxsize=WINDING_CACHE_SIZE)(
+    winding_fraction_symbols
+)
+
+
+def _fundamental_discriminant(d):
+    return d if d % 4 == 1 else 4 * d
+
+
+class TwistedWindingData:
+    """The parts of `is_rank_of_twist_zero_plus` (sign = 1) and
+    `is_rank_of_twist_zero_minus` (sign = -1) at level N which do not depend
+    on the character. Use `twisted_winding_data` to get a cached instance."""
+
+    def __init__(self, N, sign):
+        self.N = N
+        self.sign = sign
+
+        spaces = sign_part(N, sign)
+        ML = spaces["ambient"]
+        maps = [S.rational_period_mapping() for S in spaces["decomposition"]]
+
+        # the untwisted condition: {0, oo} must map to zero on every factor
+        # of the plus part, and to nonzero on every factor of the minus part
+        w = ML([0, oo])
+        wmaps = [my_map(w) for my_map in maps]
+        if sign == PLUS:
+            self.winding_condition = all(wmap == 0 for wmap in wmaps)
+        else:
+            self.winding_condition = all(wmap != 0 for wmap in wmaps)
+
+        # row j: the images of the j-th Manin symbol under all the maps
+        p1 = ML.p1list()
+        rows = []
+        for x in p1:
+            symbol = ML.manin_symbol((0,) + tuple(x))
+            rows.append(sum((list(my_map(symbol)) for my_map in maps), []))
+        self.image_matrix = matrix(QQ, rows)
+
+        self.factor_slices = []
+        start = 0
+        for wmap in wmaps:
+            self.factor_slices.append((start, start + len(wmap)))
+            start += len(wmap)
+
+        # (u mod N, v mod N) -> index in P^1(Z/NZ), or -1
+        self.symbol_index = np.array(
+            [[p1.index(u, v) for v in range(N)] for u in range(N)], dtype=np.int64
+        )
+        self.num_symbols = len(p1)
+
+    def symbol_counts(self, d, symbols_of=_recent_winding_fraction_symbols):
+        """int64 array whose j-th entry is the coefficient of the j-th Manin
+        symbol in the twisted winding element of chi_d (up to sign), with the
+        Manin symbols of each modulus from `symbols_of`"""
+
+        a, u, v = symbols_of(abs(_fundamental_discriminant(d)))
+        index = self.symbol_index[u % self.N, v % self.N]
+        if (index < 0).any():
+            raise ValueError(f"Bad Manin symbol at level {self.N} for d = {d}")
+        chi = kronecker_values(d, a).astype(np.int64)
+        return np.bincount(index, weights=chi, minlength=self.num_symbols).astype(
+            np.int64
+        )
+
+    def twist_rank_zero(self, d_vals):
+        """Dictionary d -> whether the twist by chi_d of the plus or minus
+        part has rank zero, by the same criterion as the per-d functions"""
+
+        if not self.winding_condition:
+            return {d: False for d in d_vals}
+        if not d_vals:
+            return {}
+        # a batch larger than the cache would evict every entry before
+        # another level could reuse it
+        if len(d_vals) > WINDING_CACHE_SIZE:
+            symbols_of = winding_fraction_symbols
+        else:
+            symbols_of = _recent_winding_fraction_symbols
+
+        counts = matrix(
+            ZZ, [self.symbol_counts(d, symbols_of).tolist() for d in d_vals]
+        )
+        images = counts * self.image_matrix
+
+        output = {}
+        for row, d in enumerate(d_vals):
+            image = images.row(row)
+            output[d] = all(
+                any(image[i] != 0 for i in range(start, end))
+                for start, end in self.factor_slices
+            )
+        return output
+
+
+@lru_cache(maxsize=None)
+def twisted_winding_data(N, sign):
+    return TwistedWindingData(N, sign)
+
+
+def batch_is_rank_of_twist_zero(N, d_vals, sign):
+    """Dictionary d -> `is_rank_of_twist_zero_plus(N, kronecker_character(d))`
+    (sign = 1) or `is_rank_of_twist_zero_minus(...)` (sign = -1), for each d
+    in `d_vals`, sharing all the work that does not depend on d"""
+
+    return twisted_winding_data(N, sign).twist_rank_zero(list(d_vals))
+
+
+def _batch_check_mwgp_same(p, d_vals, sign):
+    """The computation behind `batch_check_mwgp_same`. The cheap torsion
+    condition is checked first, and the rank condition only for the d
+    passing it."""
+
+    torsion_same = batch_is_torsion_same(p, d_vals, sign)
+    rank_zero = batch_is_rank_of_twist_zero(
+        p, [d for d in d_vals if torsion_same[d]], sign
+    )
+    return {d: rank_zero.get(d, False) for d in d_vals}
+
+
+def batch_check_mwgp_same(p, d_vals, sign, use_store=True):
+    """Dictionary d -> `check_mwgp_same_plus(p, d)` (sign = 1) or
+    `check_mwgp_same_minus(p, d)` (sign = -1), for each d in `d_vals`.
+    Verdicts already in the verdict store are not recomputed, and new ones
+    are added to it (see `verdict_store.py`)."""
+
+    d_vals = list(d_vals)
+    known = verdict_store.lookup(p, d_vals, sign) if use_store else {}
+    to_compute = [d for d in d_vals if d not in known]
+
+    if to_compute:
+        start = time.perf_counter()
+        computed = _batch_check_mwgp_same(p, to_compute, sign)
+        seconds = (time.perf_counter() - start) / len(to_compute)
+        if use_store:
+            verdict_store.record(p, sign, computed, seconds)
+        known.update(computed)
+
+    return {d: known[d] for d in d_vals}
+
@@ -29,16 +29,17 @@
 
 from sage.all import (
     QuadraticField,
-    kronecker_character,
-    ModularSymbols,
-    parent,
-    companion_matrix,
-    prime_range,
     oo,
-    J0,
     gcd,
-    legendre_symbol,
-    Integer,
+)
+
+from modsym_cache import sign_part
+from oezman_index import oezman_index, satisfies_cond_3
+from mwgp_batch import (
+    MINUS,
+    batch_check_mwgp_same,
+    frobenius_point_counts,
+    rational_torsion_order,
 )
 
 ### N = 43
@@ -49,47 +50,32 @@ from sage.all import (
 
 def is_torsion_same_minus(p, chi, B=30, uniform=False):
     """Returns true if the minus part of J0(p) does not gain new torsion when
-    base changing to K"""
-    M = ModularSymbols(p)
-    S = M.cuspidal_subspace()
-    T = S.atkin_lehner_operator()
-    S_min = (T + parent(T)(1)).kernel()
-    J0_min = S_min.abelian_variety()
-
-    d = 2
+    base changing to K. The point counts are computed once per level, see
+    `mwgp_batch.py`."""
+    primes, counts_over_q, counts_over_q_sq = frobenius_point_counts(p, MINUS, B)
 
     if uniform:
-        frob_poly_data = [(q, d) for q in prime_range(d + 2, B) if q != p]
+        point_counts = list(counts_over_q_sq)
     else:
-        frob_poly_data = [
-            (q, 1) if chi(q) == 1 else (q, d)
-            for q in prime_range(d + 2, B)
-            if gcd(q, p) == 1
+        point_counts = [
+            n_1 if chi(q) == 1 else n_2
+            for q, n_1, n_2 in zip(primes, counts_over_q, counts_over_q_sq)
         ]
 
-    point_counts = []
-
-    for q, i in frob_poly_data:
-        frob_pol_q = J0_min.frobenius_polynomial(q)
-        frob_mat = companion_matrix(frob_pol_q)
-        point_counts.append((frob_mat**i).charpoly()(1))
-
     # Recall that the rational torsion on J0(p) is entirely contained in
     # the minus part (theorem of Mazur), so checking no-growth of torsion
     # in minus part is done simply as follows
 
-    return J0(p).rational_torsion_order(proof=False) == gcd(point_counts)
+    return rational_torsion_order(p) == gcd(point_counts)
 
 
 def is_rank_of_twist_zero_minus(p, chi):
     """Returns true if the rank of the twist of the minus part of X_0(p)
     by the character chi is zero"""
-    ML = ModularSymbols(p, base_ring=chi.base_ring())
-    SL = ML.cuspidal_subspace()
-    TL = SL.atkin_lehner_operator()
-    S_min_L = (TL + parent(TL)(1)).kernel()
+    spaces = sign_part(p, -1, chi.base_ring())
+    ML = spaces["ambient"]
 
-    for S in S_min_L.decomposition():
+    for S in spaces["decomposition"]:
         my_map = S.rational_period_mapping()
         w = ML([0, oo])
         wmap = my_map(w)
@@ -104,11 +90,14 @@ def is_rank_of_twist_zero_minus(p, chi):
 
 
 def check_mwgp_same_minus(p, d):
-    chi = kronecker_character(d)
-    if is_rank_of_twist_zero_minus(p, chi):
-        if is_torsion_same_minus(p, chi) == 1:
-            return True
-    return False
+    """Everything not depending on d is computed once per level, see
+    `mwgp_batch.py`; the functions above are the direct versions."""
+    return batch_check_mwgp_same(p, [d], MINUS)[d]
+
+
+def batch_check_mwgp_same_minus(p, d_vals):
+    """Dictionary d -> `check_mwgp_same_minus(p, d)` for each d in `d_vals`"""
+    return batch_check_mwgp_same(p, d_vals, MINUS)
 
 
 # The following then tests that for p = 43 and d = 213, the MW groups
@@ -164,51 +153,19 @@ def oezman_sieve(p, N):
     return False
 
 
-def satisfies_cond_3(x, p):
-
-    if p % 4 != 3:
-        return False
-
-    if legendre_symbol(-x, p) != -1:
-        return False
-
-    my_prime_divs = Integer(x).prime_divisors()
-
-    if not all([q % 4 == 1 for q in my_prime_divs]):
-        return False
-
-    return True
-
-
 # Here's a wrapper which gets the ps we are able to try
 
 
 def try_oezman_sieve(d, N):
+    """Runs `oezman_sieve` on the primes ramified in Q(sqrt(d)), and then
+    part 3 of Ozman's result on the odd primes of N inert there. Everything
+    not depending on d is looked up in `oezman_index.py`, which is built
+    once per N."""
 
-    if not Integer(N).is_squarefree():
-        return True
-
-    disc_of_quad_field = d if d % 4 == 1 else 4 * d
-    ram_primes = Integer(disc_of_quad_field).prime_divisors()
-
-    for p in ram_primes:
-        if not oezman_sieve(p, N):
-            return False
-
-    # Try part 3 of Ozman's result
-    odd_prime_divs = [p for p in Integer(N).prime_divisors() if p % 2 == 1]
-    odd_prime_divs_inert_in_K = [
-        p for p in odd_prime_divs if legendre_symbol(d, p) == -1
-    ]
-
-    for p in odd_prime_divs_inert_in_K:
-        quo = N / (2 * p) if N % 2 == 0 else N / p
-        if not satisfies_cond_3(quo, p):
-            return False
-
-    return True
+    return oezman_index.try_oezman_sieve(int(d), int(N))
 
 
-# Now we try it
+def batch_try_oezman_sieve(d_vals, N):
+    """Dictionary d -> `try_oezman_sieve(d, N)` for each d in `d_vals`"""
 
-# try_oezman_sieve(213, 65)  # False, which is what we wanted
+    return oezman_index.batch_try_oezman_sieve([int(d) for d in d_vals], int(N))
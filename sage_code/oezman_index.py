@@ -0,0 +1,195 @@
+"""oezman_index.py
+
+    An index for the Oezman sieve (`try_oezman_sieve`), one entry per
+    squarefree level N.
+
+    The sieve fails for d if some prime p ramified in Q(sqrt(d)) splits in
+    M = Q(sqrt(-N)) into non-principal primes, or if some odd prime p | N
+    inert in Q(sqrt(d)) fails condition 3 of Oezman's result. Only the
+    primes ramified or inert in Q(sqrt(d)) depend on d. So for each N we
+    record, once, the discriminant and class number of M, the primes up to
+    a bound which kill the sieve, and the odd p | N failing condition 3;
+    a query for d then only looks at the primes dividing the discriminant
+    of Q(sqrt(d)) and at Legendre symbols.
+
+    A split prime p is principal in M iff the binary quadratic form of
+    discriminant disc(M) representing p reduces to the principal form, which
+    PARI decides without building M or its class group. The entries are
+    kept in a JSON file, so each N is only ever done once.
+
+    ====================================================================
+
+    This file is part of Quadratic Kenku Solver.
+
+    Copyright (C) 2022 Barinder S. Banwait, Filip Najman, and Oana
+    Padurariu
+
+    Quadratic Kenku Solver is free software: you can redistribute it
+    and/or modify it under the terms of the GNU General Public License
+    as published by the Free Software Foundation, either version 3 of
+    the License, or any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+    ====================================================================
+
+"""
+
+import json
+import os
+
+from sage.all import pari
+
+from disc_index import ramified_primes
+from sieves import prime_divisors, primes_up_to
+
+OEZMAN_INDEX_PATH = "cache/oezman_index.json"
+# Killing primes are listed up to this bound; larger ones are decided on demand
+OEZMAN_PRIME_BOUND = 10000
+
+
+def _legendre(a, p):
+    """The Legendre symbol (a / p) for an odd prime p"""
+
+    r = pow(a % p, (p - 1) // 2, p)
+    return -1 if r == p - 1 else r
+
+
+def is_squarefree(N):
+
+    return all(N % (p * p) != 0 for p in prime_divisors(N))
+
+
+def satisfies_cond_3(x, p):
+
+    if p % 4 != 3:
+        return False
+
+    if _legendre(-x, p) != -1:
+        return False
+
+    my_prime_divs = prime_divisors(x)
+
+    if not all([q % 4 == 1 for q in my_prime_divs]):
+        return False
+
+    return True
+
+
+def kills_sieve(D, p):
+    """Whether p splits in the imaginary quadratic field of discriminant D
+    into non-principal primes"""
+
+    if pari.kronecker(D, p) != 1:
+        return False
+    return pari.qfbred(pari.qfbprimeform(D, p))[0] != 1
+
+
+def build_entry(N, bound=OEZMAN_PRIME_BOUND):
+    """The index entry of the squarefree level N"""
+
+    D = -N if N % 4 == 3 else -4 * N
+    class_number = int(pari.qfbclassno(D))
+
+    if class_number == 1:
+        killing_primes = []
+    else:
+        killing_primes = [p for p in primes_up_to(bound) if kills_sieve(D, p)]
+
+    cond_3_failures = []
+    for p in prime_divisors(N):
+        if p % 2 == 1:
+            quo = N // (2 * p) if N % 2 == 0 else N // p
+            if not satisfies_cond_3(quo, p):
+                cond_3_failures.append(p)
+
+    return {
+        "disc": D,
+        "class_number": class_number,
+        "bound": bound,
+        "killing_primes": killing_primes,
+        "cond_3_failures": cond_3_failures,
+    }
+
+
+class OezmanIndex:
+    """The index entries, read from and added to the file at `path`"""
+
+    def __init__(self, path=OEZMAN_INDEX_PATH, bound=OEZMAN_PRIME_BOUND):
+        self.path = path
+        self.bound = bound
+        self._entries = None
+        self._killing_sets = {}
+        self._large_primes = {}
+
+    def _read_file(self):
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, "r") as index_file:
+            return {int(N): entry for N, entry in json.load(index_file).items()}
+
+    def _write_file(self):
+        # merge with what other processes may have added meanwhile
+        all_entries = {**self._read_file(), **self._entries}
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp{os.getpid()}"
+        with open(tmp_path, "w") as index_file:
+            json.dump({str(N): entry for N, entry in sorted(all_entries.items())}, index_file)
+        os.replace(tmp_path, self.path)
+
+    def entry(self, N):
+        """The entry of the squarefree level N, built if need be"""
+
+        if self._entries is None:
+            self._entries = self._read_file()
+
+        if N not in self._entries or self._entries[N]["bound"] < self.bound:
+            self._entries[N] = build_entry(N, self.bound)
+            self._write_file()
+
+        return self._entries[N]
+
+    def kills(self, N, p):
+        """Whether the ramified prime p makes the sieve fail at N"""
+
+        entry = self.entry(N)
+        if entry["class_number"] == 1:
+            return False
+        if p <= entry["bound"]:
+            if N not in self._killing_sets:
+                self._killing_sets[N] = set(entry["killing_primes"])
+            return p in self._killing_sets[N]
+        if (N, p) not in self._large_primes:
+            self._large_primes[(N, p)] = kills_sieve(entry["disc"], p)
+        return self._large_primes[(N, p)]
+
+    def try_oezman_sieve(self, d, N):
+        """Same as `non_hyperelliptic_verifs.try_oezman_sieve`"""
+
+        if not is_squarefree(N):
+            return True
+
+        for p in ramified_primes(d):
+            if self.kills(N, p):
+                return False
+
+        # Try part 3 of Ozman's result
+        for p in self.entry(N)["cond_3_failures"]:
+            if _legendre(d, p) == -1:
+                return False
+
+        return True
+
+    def batch_try_oezman_sieve(self, d_vals, N):
+        """Dictionary d -> `try_oezman_sieve(d, N)` for each d in `d_vals`"""
+
+        return {d: self.try_oezman_sieve(d, N) for d in d_vals}
+
+
+oezman_index = OezmanIndex()
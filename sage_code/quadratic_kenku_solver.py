@@ -32,18 +32,19 @@ from sage.all import (
     QuadraticField,
     cm_j_invariants,
     magma,
-    EllipticCurve,
     Infinity,
 )
-from utils import minimally_finite_fast, GENUS_ONE_LIST, HYPERELLIPTIC_VALUES
+from utils import minimally_finite_fast, GENUS_ONE_LIST
+from level_tables import ELLIPTIC, HYPERELLIPTIC, classify_level
 from large_possible_isogeny_primes import LPIP
 from isogeny_graphs import unrecorded_isogenies
-from hyperelliptic_verifs import try_trbovic_filter
+from hyperelliptic_verifs import batch_try_trbovic_filter
 from non_hyperelliptic_verifs import (
     try_oezman_sieve,
     check_mwgp_same_minus,
 )
 from utils import check_mwgp_same_plus
+from twisted_lvalues import twist_has_rank_zero
 from functools import reduce
 
 QUADRATIC_POINTS_DATA_PATH = "quadratic_points_catalogue.json"
@@ -182,10 +183,13 @@ def process_hyperelliptic(d, K_gen, hyperelliptic_vals):
     output_dict = {}
     K = K_gen.parent()
     failed_dict = {}
+    trbovic_passes = batch_try_trbovic_filter(
+        [d], [z for z in hyperelliptic_vals if z != 37]
+    )
     for z in hyperelliptic_vals:
         data_this_z = qdpts_dat[str(z)]
         if z != 37:
-            if try_trbovic_filter(d, z):
+            if trbovic_passes[(d, z)]:
                 if try_oezman_sieve(d, z):
                     raise NotImplementedError(f"d = {d}, z={z}")
             j_invs_str = data_this_z["non_cm_points"].get(str(d), [])
@@ -206,7 +210,7 @@ def process_hyperelliptic(d, K_gen, hyperelliptic_vals):
             failed_dict = {**non_37_failed_dict, **failed_dict}
         else:
             # 37 requires special handling
-            if EllipticCurve("37b1").quadratic_twist(d).analytic_rank() == 0:
+            if twist_has_rank_zero("37b1", d):
                 # if (
                 #     eval(
                 #         str(magma.eval(format_preimages_magma_function(d))).split(
@@ -364,9 +368,9 @@ def quadratic_kenku_solver(d):
     my_non_hyperelliptic_vals = []
 
     for mf_val in minimally_finite:
-        if mf_val in GENUS_ONE_LIST:
+        if classify_level(mf_val) == ELLIPTIC:
             my_elliptic_vals.append(mf_val)
-        elif mf_val in HYPERELLIPTIC_VALUES:
+        elif classify_level(mf_val) == HYPERELLIPTIC:
             my_hyperelliptic_vals.append(mf_val)
         else:
             my_non_hyperelliptic_vals.append(mf_val)
@@ -0,0 +1,346 @@
+"""rank_data_store.py
+
+    A compact on-disk store for the rank data of the genus one modular
+    curves X_0(N) over Q(sqrt(d)), to replace eval-parsing
+    `magma_code/RankData.txt` at import.
+
+    The file holds one 12-bit mask per d (bit i set iff the i-th level has
+    rank zero over Q(sqrt(d))), in a memory-mapped array sorted by d. The
+    d -> row lookup is a binary search on that array, so opening the store
+    costs the same however many d values it holds. Layout, all little-endian:
+
+        header   : magic b"QKRD", version (uint16), number of levels n (uint16),
+                   number of rows m (uint32)
+        levels   : n x uint16, the levels N in bit order
+        d values : m x int32, strictly increasing
+        masks    : m x uint16
+        undetermined masks (version 2 only) : m x uint16
+
+    In an undetermined mask, bit i is set iff the rank of the i-th level over
+    Q(sqrt(d)) could not be determined; the corresponding bit of the rank
+    zero mask is then clear. Version 1 files have no undetermined masks and
+    are still read.
+
+    The binary store is derived data and may be rebuilt from the text file
+    at any time, so the ranks added by the rank engine (see `update`) are
+    also appended to an overlay file, one JSON object per line, which is
+    read on top of the text file whenever the store is rebuilt. A rebuild
+    which would lose rows of the binary store is refused.
+
+    ====================================================================
+
+    This file is part of Quadratic Kenku Solver.
+
+    Copyright (C) 2022 Barinder S. Banwait, Filip Najman, and Oana
+    Padurariu
+
+    Quadratic Kenku Solver is free software: you can redistribute it
+    and/or modify it under the terms of the GNU General Public License
+    as published by the Free Software Foundation, either version 3 of
+    the License, or any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+    ====================================================================
+
+"""
+
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+from collections.abc import Mapping
+
+MAGIC = b"QKRD"
+VERSION = 2
+HEADER = struct.Struct("<4sHHI")
+
+
+def read_rank_data_text(text_path):
+    """Parses the Magma output `RankData.txt`, whose lines look like
+    `-9998: [ 14, 15, 19, 21, 24, 36 ]`, into a dictionary d -> list of N
+    for which X_0(N) has rank zero over Q(sqrt(d))"""
+
+    output = {}
+
+    with open(text_path, "r") as the_file:
+        for a_line in the_file:
+            if not a_line.strip():
+                continue
+            d, my_list = a_line.split(":")
+            my_list = my_list.strip().strip("[]").split(",")
+            output[int(d)] = [int(N) for N in my_list if N.strip()]
+
+    return output
+
+
+def read_overlay(overlay_path):
+    """Reads the overlay file into a dictionary d -> (list of rank zero
+    levels, list of undetermined levels); later lines replace earlier ones"""
+
+    output = {}
+    if overlay_path is None or not os.path.exists(overlay_path):
+        return output
+
+    with open(overlay_path, "r") as overlay_file:
+        for a_line in overlay_file:
+            if a_line.strip():
+                entry = json.loads(a_line)
+                output[entry["d"]] = (entry["rank_zero"], entry["undetermined"])
+
+    return output
+
+
+def append_overlay(overlay_path, entries):
+    """Appends a dictionary d -> (list of rank zero levels, list of
+    undetermined levels) to the overlay file"""
+
+    with open(overlay_path, "a") as overlay_file:
+        for d in sorted(entries):
+            rank_zero, undetermined = entries[d]
+            entry = {"d": int(d), "rank_zero": rank_zero, "undetermined": undetermined}
+            overlay_file.write(json.dumps(entry) + "\n")
+        overlay_file.flush()
+        os.fsync(overlay_file.fileno())
+
+
+def _write_masks(mask_data, bin_path, levels):
+    """Writes a dictionary d -> (rank zero mask, undetermined mask) to
+    `bin_path`. The file is written to a temporary path first and then moved
+    into place, so readers never see a half-written store."""
+
+    d_vals = array("i")
+    masks = array("H")
+    undetermined_masks = array("H")
+    for d in sorted(mask_data):
+        d_vals.append(int(d))
+        masks.append(mask_data[d][0])
+        undetermined_masks.append(mask_data[d][1])
+
+    level_arr = array("H", levels)
+    if sys.byteorder != "little":
+        for arr in (level_arr, d_vals, masks, undetermined_masks):
+            arr.byteswap()
+
+    tmp_path = f"{bin_path}.tmp{os.getpid()}"
+    with open(tmp_path, "wb") as bin_file:
+        bin_file.write(HEADER.pack(MAGIC, VERSION, len(levels), len(d_vals)))
+        bin_file.write(level_arr.tobytes())
+        bin_file.write(d_vals.tobytes())
+        bin_file.write(masks.tobytes())
+        bin_file.write(undetermined_masks.tobytes())
+    os.replace(tmp_path, bin_path)
+
+
+def _mask_of(level_list, bit_of):
+    return sum(1 << bit_of[int(N)] for N in level_list)
+
+
+def write_rank_data(rank_data, bin_path, levels, overlay=None):
+    """Writes a dictionary d -> list of rank zero levels to `bin_path` in the
+    format described at the top of this file, with the entries of `overlay`
+    (as returned by `read_overlay`) on top"""
+
+    levels = [int(N) for N in levels]
+    bit_of = {N: i for i, N in enumerate(levels)}
+
+    mask_data = {
+        d: (_mask_of(rank_zero_list, bit_of), 0)
+        for d, rank_zero_list in rank_data.items()
+    }
+    for d, (rank_zero, undetermined) in (overlay or {}).items():
+        mask_data[d] = (_mask_of(rank_zero, bit_of), _mask_of(undetermined, bit_of))
+    _write_masks(mask_data, bin_path, levels)
+
+
+def convert_rank_data_text(text_path, bin_path, levels, overlay_path=None):
+    """Converts the existing text rank data, and the overlay if any, into
+    the binary store. Refuses to replace a binary store with rows which
+    neither of them has."""
+
+    rank_data = read_rank_data_text(text_path)
+    overlay = read_overlay(overlay_path)
+
+    if os.path.exists(bin_path):
+        lost = [
+            d
+            for d in RankDataStore(bin_path)
+            if d not in rank_data and d not in overlay
+        ]
+        if lost:
+            raise ValueError(
+                f"{bin_path} has ranks for {len(lost)} d values (e.g. {lost[0]}) which "
+                f"neither {text_path} nor the overlay {overlay_path} has; rebuilding "
+                "it would lose them, so add them to one of those first"
+            )
+
+    write_rank_data(rank_data, bin_path, levels, overlay)
+
+
+class RankDataStore(Mapping):
+    """Read-only mapping d -> list of rank zero levels, backed by the binary
+    store at `bin_path`. This is a drop-in replacement for the dictionary
+    that used to be built from the text file.
+
+    Nothing is read until the store is first used. If `text_path` is given
+    and the binary file is missing or older than the text file or the
+    overlay at `overlay_path`, it is (re)built from these at that point.
+    """
+
+    def __init__(self, bin_path, text_path=None, levels=None, overlay_path=None):
+        self.bin_path = bin_path
+        self.text_path = text_path
+        self.overlay_path = overlay_path
+        self._expected_levels = None if levels is None else [int(N) for N in levels]
+        self._d_vals = None
+
+    def _needs_conversion(self):
+        if self.text_path is None:
+            return False
+        if not os.path.exists(self.bin_path):
+            return True
+        sources = [self.text_path]
+        if self.overlay_path is not None and os.path.exists(self.overlay_path):
+            sources.append(self.overlay_path)
+        bin_mtime = os.path.getmtime(self.bin_path)
+        return any(bin_mtime < os.path.getmtime(path) for path in sources)
+
+    def _open(self):
+        if self._d_vals is not None:
+            return
+
+        if self._needs_conversion():
+            if self._expected_levels is None:
+                raise ValueError("levels are needed to convert the text rank data")
+            convert_rank_data_text(
+                self.text_path, self.bin_path, self._expected_levels, self.overlay_path
+            )
+
+        with open(self.bin_path, "rb") as bin_file:
+            self._mmap = mmap.mmap(bin_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, num_levels, num_rows = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version not in (1, 2):
+            raise ValueError(f"{self.bin_path} is not a rank store")
+
+        buf = memoryview(self._mmap)
+        offset = HEADER.size
+        level_view = buf[offset : offset + 2 * num_levels]
+        offset += 2 * num_levels
+        d_view = buf[offset : offset + 4 * num_rows]
+        offset += 4 * num_rows
+        mask_view = buf[offset : offset + 2 * num_rows]
+        offset += 2 * num_rows
+        if version >= 2:
+            undetermined_view = buf[offset : offset + 2 * num_rows]
+        else:
+            undetermined_view = memoryview(bytes(2 * num_rows))
+
+        views = (
+            (level_view, "H"),
+            (d_view, "i"),
+            (mask_view, "H"),
+            (undetermined_view, "H"),
+        )
+        if sys.byteorder == "little":
+            arrays = [view.cast(typecode) for view, typecode in views]
+        else:
+            # no memory mapping on big-endian machines, just byteswapped copies
+            arrays = []
+            for view, typecode in views:
+                arr = array(typecode, view.tobytes())
+                arr.byteswap()
+                arrays.append(arr)
+
+        self.levels = arrays[0].tolist()
+        self._d_vals, self._masks, self._undetermined_masks = arrays[1:]
+
+        if self._expected_levels is not None and self.levels != self._expected_levels:
+            raise ValueError(
+                f"{self.bin_path} was built for levels {self.levels}, "
+                f"not {self._expected_levels}; please rebuild it"
+            )
+
+    def _row(self, d):
+        self._open()
+        row = bisect_left(self._d_vals, d)
+        if row == len(self._d_vals) or self._d_vals[row] != d:
+            raise KeyError(d)
+        return row
+
+    def mask(self, d):
+        """The rank zero mask at d; bit i corresponds to `self.levels[i]`"""
+        row = self._row(d)
+        return self._masks[row]
+
+    def undetermined_mask(self, d):
+        """The mask of levels whose rank over Q(sqrt(d)) is not known"""
+        row = self._row(d)
+        return self._undetermined_masks[row]
+
+    def mask_items(self):
+        """Iterates over pairs (d, mask) in increasing order of d"""
+        self._open()
+        return zip(self._d_vals, self._masks)
+
+    def status_items(self):
+        """Iterates over triples (d, mask, undetermined mask) in increasing
+        order of d"""
+        self._open()
+        return zip(self._d_vals, self._masks, self._undetermined_masks)
+
+    def update(self, new_masks):
+        """Merges a dictionary d -> (rank zero mask, undetermined mask) into
+        the store, replacing the masks of any d already present, and rewrites
+        the file, after appending them to the overlay file if there is one.
+        Only one process should update a given store at a time."""
+        self._open()
+        if self.overlay_path is not None:
+            append_overlay(
+                self.overlay_path,
+                {
+                    d: (self.levels_from_mask(mask), self.levels_from_mask(undet))
+                    for d, (mask, undet) in new_masks.items()
+                },
+            )
+        mask_data = {d: (mask, undet) for d, mask, undet in self.status_items()}
+        mask_data.update(new_masks)
+        levels = self.levels
+        # drop our views of the old file before replacing it
+        self._d_vals = self._masks = self._undetermined_masks = None
+        self._mmap = None
+        _write_masks(mask_data, self.bin_path, levels)
+
+    def levels_from_mask(self, mask):
+        self._open()
+        return [N for i, N in enumerate(self.levels) if (mask >> i) & 1]
+
+    def __getitem__(self, d):
+        return self.levels_from_mask(self.mask(d))
+
+    def __contains__(self, d):
+        try:
+            self._row(d)
+        except (KeyError, TypeError):
+            return False
+        return True
+
+    def __iter__(self):
+        self._open()
+        return iter(self._d_vals)
+
+    def __len__(self):
+        self._open()
+        return len(self._d_vals)
+
+    def items(self):
+        return ((d, self.levels_from_mask(mask)) for d, mask in self.mask_items())
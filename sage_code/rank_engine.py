@@ -0,0 +1,275 @@
+"""rank_engine.py
+
+    Extends the rank data of the quadratic twists of the genus one X_0(N)
+    without Magma. Each missing (N, d) is decided with Sage/PARI in its own
+    child process with a deadline, several at a time, and the results go
+    into the same rank data store that `minimally_finite_fast` reads. A
+    pair that cannot be decided in time, or for which PARI falls over, is
+    recorded as undetermined rather than stopping the run; rerunning the
+    engine retries exactly those pairs.
+
+    ====================================================================
+
+    This file is part of Quadratic Kenku Solver.
+
+    Copyright (C) 2022 Barinder S. Banwait, Filip Najman, and Oana
+    Padurariu
+
+    Quadratic Kenku Solver is free software: you can redistribute it
+    and/or modify it under the terms of the GNU General Public License
+    as published by the Free Software Foundation, either version 3 of
+    the License, or any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+    ====================================================================
+
+"""
+
+import logging
+from itertools import chain
+
+from sage.all import EllipticCurve, pari
+
+from deadline_executor import OK, run_jobs
+from sieves import squarefree_segments
+from twisted_lvalues import exact_rank_zero, fits_series, series_verdicts
+from utils import GENUS_ONE_LIST, rank_data_dict
+
+logger = logging.getLogger(__name__)
+
+RANK_ZERO = "zero"
+POSITIVE_RANK = "positive"
+UNDETERMINED = "undetermined"
+
+DEFAULT_METHODS = ("analytic", "ellrank")
+TASK_DEADLINE_S = 60
+NUM_WORKERS = 4
+
+# L-values smaller than this are not trusted to be nonzero
+ANALYTIC_EPS = 1e-10
+
+
+def analytic_rank_status(E):
+    """A central value L(E, 1) which is visibly nonzero gives rank zero, by
+    Kolyvagin. Root number -1 together with a visibly nonzero L'(E, 1) gives
+    rank one, by Gross-Zagier-Kolyvagin. Anything else is undetermined."""
+
+    rank, value = pari(E).ellanalyticrank()
+    if abs(value) < ANALYTIC_EPS:
+        return UNDETERMINED
+    if rank == 0:
+        return RANK_ZERO
+    if rank == 1 and E.root_number() == -1:
+        return POSITIVE_RANK
+    return UNDETERMINED
+
+
+def ellrank_status(E):
+    """Uses the lower and upper bounds on the rank from PARI's `ellrank`"""
+
+    lower, upper = pari(E).ellrank()[:2]
+    if upper == 0:
+        return RANK_ZERO
+    if lower > 0:
+        return POSITIVE_RANK
+    return UNDETERMINED
+
+
+RANK_METHODS = {
+    "analytic": analytic_rank_status,
+    "ellrank": ellrank_status,
+}
+
+
+def twist_rank_status(N, d, methods=DEFAULT_METHODS, exact_lvalue=False):
+    """Decides whether the twist by d of X_0(N) has rank zero, trying the
+    methods in order, after the exact central value of `twisted_lvalues` if
+    `exact_lvalue` is set. Returns the status together with the method
+    which decided it (None if none did)."""
+
+    if exact_lvalue:
+        try:
+            if exact_rank_zero(str(N) + "a1", d):
+                return RANK_ZERO, "lvalue"
+        except Exception as err_msg:
+            logger.debug(f"lvalue failed for N = {N}, d = {d}: {err_msg}")
+
+    E = EllipticCurve(str(N) + "a1").quadratic_twist(d)  # X_0(N)
+
+    for method in methods:
+        try:
+            status = RANK_METHODS[method](E)
+        except Exception as err_msg:
+            logger.debug(f"{method} failed for N = {N}, d = {d}: {err_msg}")
+            continue
+        if status != UNDETERMINED:
+            return status, method
+
+    return UNDETERMINED, None
+
+
+def run_rank_tasks(
+    tasks,
+    num_workers=NUM_WORKERS,
+    deadline=TASK_DEADLINE_S,
+    methods=DEFAULT_METHODS,
+    exact_lvalue=frozenset(),
+):
+    """Runs `twist_rank_status` on each (N, d) of `tasks` in its own child
+    process, at most `num_workers` at a time, killing any that run for
+    longer than `deadline` seconds; the (N, d) in `exact_lvalue` try the
+    exact central value first. Yields (N, d, status, method) as the tasks
+    finish; killed and crashed tasks are undetermined, with how they ended
+    as the method."""
+
+    jobs = [
+        ((N, d), twist_rank_status, (N, d, methods, (N, d) in exact_lvalue))
+        for N, d in tasks
+    ]
+
+    for (N, d), outcome in run_jobs(jobs, num_workers, deadline):
+        if outcome.status == OK:
+            status, method = outcome.value
+        else:
+            status, method = UNDETERMINED, outcome.status
+        yield N, d, status, method
+
+
+def missing_rank_entries(d_vals, store=None):
+    """The pairs (N, d), for d in `d_vals`, whose rank status is not in the
+    store: all levels for d absent from it, and the undetermined ones for d
+    present in it"""
+
+    if store is None:
+        store = rank_data_dict
+
+    tasks = []
+    for d in d_vals:
+        if d in store:
+            undetermined = store.undetermined_mask(d)
+            tasks += [(N, d) for N in store.levels_from_mask(undetermined)]
+        else:
+            tasks += [(N, d) for N in GENUS_ONE_LIST]
+    return tasks
+
+
+def resolve_rank_zero_in_bulk(tasks):
+    """Splits the tasks into those whose twist has a central value clearly
+    away from zero, found all at once for each level by `series_verdicts`
+    and returned as finished results, and the remaining tasks. Also returns
+    the remaining tasks whose central value the series left undecided but
+    which the exact modular symbol sum can decide; these go to child
+    processes like the others, while the twists too large for the series
+    are left to the "analytic" method there."""
+
+    d_vals_at = {}
+    for N, d in tasks:
+        d_vals_at.setdefault(N, []).append(d)
+
+    resolved = []
+    remaining = []
+    exact_lvalue = set()
+    for N, d_vals in d_vals_at.items():
+        label = str(N) + "a1"
+        verdicts = series_verdicts(label, d_vals)
+        for d in d_vals:
+            if verdicts[d]:
+                resolved.append((N, d, RANK_ZERO, "lvalue"))
+                continue
+            remaining.append((N, d))
+            if verdicts[d] is None and fits_series(label, d):
+                exact_lvalue.add((N, d))
+
+    logger.info(f"{len(resolved)} twists have rank zero from their L-values")
+    return resolved, remaining, exact_lvalue
+
+
+def fill_rank_data(
+    d_vals,
+    num_workers=NUM_WORKERS,
+    deadline=TASK_DEADLINE_S,
+    methods=DEFAULT_METHODS,
+    store=None,
+    flush_every=500,
+    bulk_lvalues=True,
+):
+    """Computes the missing rank data for the given values of d and merges it
+    into the store (default: `rank_data_dict`), writing it out every
+    `flush_every` finished tasks so that little is lost on a crash. Returns
+    the number of tasks ending in each status.
+
+    If `bulk_lvalues` is set, the rank zero twists are first picked out in
+    bulk from their central L-values, and only the rest get a child process;
+    those whose value was too close to zero try its exact value there.
+    """
+
+    if store is None:
+        store = rank_data_dict
+
+    tasks = missing_rank_entries(d_vals, store)
+    logger.info(f"{len(tasks)} (N, d) pairs to compute")
+
+    if bulk_lvalues:
+        resolved, tasks, exact_lvalue = resolve_rank_zero_in_bulk(tasks)
+    else:
+        resolved, exact_lvalue = [], frozenset()
+    results = chain(
+        resolved, run_rank_tasks(tasks, num_workers, deadline, methods, exact_lvalue)
+    )
+
+    bit_of = {N: i for i, N in enumerate(GENUS_ONE_LIST)}
+    all_levels = (1 << len(GENUS_ONE_LIST)) - 1
+    masks = {}
+    dirty = {}
+    status_count = {RANK_ZERO: 0, POSITIVE_RANK: 0, UNDETERMINED: 0}
+
+    for N, d, status, method in results:
+        if d not in masks:
+            if d in store:
+                masks[d] = (store.mask(d), store.undetermined_mask(d))
+            else:
+                masks[d] = (0, all_levels)
+        mask, undetermined = masks[d]
+        bit = 1 << bit_of[N]
+
+        if status == RANK_ZERO:
+            mask, undetermined = mask | bit, undetermined & ~bit
+        elif status == POSITIVE_RANK:
+            mask, undetermined = mask & ~bit, undetermined & ~bit
+        else:
+            logger.warning(
+                f"Rank of X_0({N}) over Q(sqrt({d})) undetermined ({method})"
+            )
+            mask, undetermined = mask & ~bit, undetermined | bit
+
+        masks[d] = dirty[d] = (mask, undetermined)
+        status_count[status] += 1
+
+        if len(dirty) >= flush_every:
+            store.update(dirty)
+            dirty = {}
+
+    if dirty:
+        store.update(dirty)
+
+    logger.info(f"Rank engine finished: {status_count}")
+    return status_count
+
+
+def fill_rank_data_range(d_start, d_end, **kwargs):
+    """Runs `fill_rank_data` on the squarefree d != 1 with d_start <= d < d_end"""
+
+    d_vals = [
+        d
+        for _, segment in squarefree_segments(d_start, d_end, 10000)
+        for d in segment
+        if d != 1
+    ]
+    return fill_rank_data(d_vals, **kwargs)
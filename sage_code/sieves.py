@@ -0,0 +1,151 @@
+"""sieves.py
+
+    Plain Python sieves over ranges of integers, used to sweep large ranges
+    of d without testing each value separately. Nothing here depends on Sage,
+    so these may be used in worker processes cheaply.
+
+    ====================================================================
+
+    This file is part of Quadratic Kenku Solver.
+
+    Copyright (C) 2022 Barinder S. Banwait, Filip Najman, and Oana
+    Padurariu
+
+    Quadratic Kenku Solver is free software: you can redistribute it
+    and/or modify it under the terms of the GNU General Public License
+    as published by the Free Software Foundation, either version 3 of
+    the License, or any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+    ====================================================================
+
+"""
+
+from math import isqrt
+
+
+def primes_up_to(n):
+    """The list of primes p <= n, by the sieve of Eratosthenes"""
+
+    if n < 2:
+        return []
+
+    is_prime = bytearray([1]) * (n + 1)
+    is_prime[0] = is_prime[1] = 0
+    for p in range(2, isqrt(n) + 1):
+        if is_prime[p]:
+            is_prime[p * p :: p] = bytes(len(range(p * p, n + 1, p)))
+
+    return [p for p in range(n + 1) if is_prime[p]]
+
+
+def squarefree_in_segment(lo, hi, primes):
+    """The integers d in [lo, hi) with |d| squarefree, in increasing order.
+    `primes` must contain every prime p with p^2 <= max(|lo|, |hi - 1|).
+    Zero is never returned."""
+
+    if hi <= lo:
+        return []
+
+    is_squarefree = bytearray([1]) * (hi - lo)
+
+    for p in primes:
+        p_sq = p * p
+        if p_sq > max(abs(lo), abs(hi - 1)):
+            break
+        first_multiple = -(-lo // p_sq) * p_sq
+        start = first_multiple - lo
+        is_squarefree[start::p_sq] = bytes(len(range(start, hi - lo, p_sq)))
+
+    return [lo + i for i, flag in enumerate(is_squarefree) if flag and lo + i != 0]
+
+
+def squarefree_segments(d_start, d_end, segment_size, first_segment=0):
+    """Generator over the segments [d_start + k * segment_size, ...) of
+    [d_start, d_end), for k >= first_segment, yielding pairs (k, list of d in
+    the segment with |d| squarefree). Only one segment is held in memory at
+    a time."""
+
+    primes = primes_up_to(isqrt(max(abs(d_start), abs(d_end - 1))))
+    num_segments = -(-(d_end - d_start) // segment_size)
+
+    for k in range(first_segment, num_segments):
+        lo = d_start + k * segment_size
+        hi = min(lo + segment_size, d_end)
+        yield k, squarefree_in_segment(lo, hi, primes)
+
+
+def prime_divisors(n):
+    """The primes dividing the nonzero integer n, in increasing order, by
+    trial division. Only meant for the small n (such as values of d) met in
+    this project."""
+
+    n = abs(int(n))
+    output = []
+    p = 2
+    while p * p <= n:
+        if n % p == 0:
+            output.append(p)
+            while n % p == 0:
+                n //= p
+        p += 1 if p == 2 else 2
+    if n > 1:
+        output.append(n)
+    return output
+
+
+def smallest_prime_factors(n):
+    """List whose k-th entry is the smallest prime factor of k, for
+    2 <= k <= n (the entries at 0 and 1 are 0 and 1)"""
+
+    spf = list(range(n + 1))
+    for p in range(2, isqrt(n) + 1):
+        if spf[p] == p:
+            for k in range(p * p, n + 1, p):
+                if spf[k] == k:
+                    spf[k] = p
+    return spf
+
+
+def factor_with_spf(n, spf):
+    """Dictionary p -> exponent of the factorisation of 1 <= n < len(spf),
+    read off the smallest prime factor table `spf`"""
+
+    output = {}
+    while n > 1:
+        p = spf[n]
+        n //= p
+        output[p] = output.get(p, 0) + 1
+    return output
+
+
+def prime_factors_in_segment(lo, hi, primes):
+    """List whose i-th entry is the increasing list of primes dividing
+    lo + i, for lo <= lo + i < hi (the entry for 0 is empty). `primes` must
+    contain every prime p with p^2 <= max(|lo|, |hi - 1|)."""
+
+    cofactors = [abs(n) for n in range(lo, hi)]
+    factors = [[] for _ in range(hi - lo)]
+
+    for p in primes:
+        if p * p > max(abs(lo), abs(hi - 1)):
+            break
+        for i in range((-lo) % p, hi - lo, p):
+            if cofactors[i] == 0:
+                continue
+            factors[i].append(p)
+            while cofactors[i] % p == 0:
+                cofactors[i] //= p
+
+    for i, cofactor in enumerate(cofactors):
+        if cofactor > 1:
+            factors[i].append(cofactor)
+
+    return factors
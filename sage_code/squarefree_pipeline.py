@@ -0,0 +1,291 @@
+"""squarefree_pipeline.py
+
+    A streaming version of `search_convenient_d_slow` for very large ranges
+    of d. The work is a chain of generators, one segment of d values at a
+    time:
+
+        squarefree d (segmented sieve) -> rank mask lookup
+            -> minimally finite classification -> check at 163 -> sink
+
+    Each stage pulls from the one before it, so only a bounded number of
+    segments is ever alive and a slow stage holds back the stages upstream of
+    it. The check at 163, which is by far the most expensive stage, may be
+    spread over a process pool. The sink commits segments in order and
+    records the last committed one, so that an interrupted run resumes from
+    there.
+
+    The d without complete rank data cannot be classified, and travel
+    alongside each segment to a file of their own, so that they can be
+    filled in by `rank_engine.fill_rank_data` (see `read_undetermined`) and
+    searched again.
+
+    ====================================================================
+
+    This file is part of Quadratic Kenku Solver.
+
+    Copyright (C) 2022 Barinder S. Banwait, Filip Najman, and Oana
+    Padurariu
+
+    Quadratic Kenku Solver is free software: you can redistribute it
+    and/or modify it under the terms of the GNU General Public License
+    as published by the Free Software Foundation, either version 3 of
+    the License, or any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+    ====================================================================
+
+"""
+
+import json
+import logging
+import os
+from collections import deque
+from multiprocessing import Pool
+
+from sieves import squarefree_segments
+from utils import (
+    CLASS_NUMBER_ONE_DISCS,
+    LPIP,
+    batch_check_mwgp_same_plus,
+    easy_large_vals_table,
+    lpip_hard_d_values,
+    rank_data_dict,
+)
+
+logger = logging.getLogger(__name__)
+
+PIPELINE_OUTPUT_PATH = "convenient_values_stream.txt"
+PIPELINE_CHECKPOINT_PATH = "convenient_values_stream.checkpoint"
+PIPELINE_UNDETERMINED_PATH = "convenient_values_stream.undetermined.txt"
+SEGMENT_SIZE = 10000
+
+
+def rank_mask_stage(segments, rank_data):
+    """Attaches the rank zero mask to each d. Values of d outside the rank
+    data, or with some rank undetermined, are set aside with the segment as
+    its undetermined values, for the sink to record"""
+
+    for k, d_vals in segments:
+        with_masks = []
+        undetermined = []
+        for d in d_vals:
+            if d == 1 or d in CLASS_NUMBER_ONE_DISCS:
+                continue
+            try:
+                if rank_data.undetermined_mask(d):
+                    undetermined.append(d)
+                else:
+                    with_masks.append((d, rank_data.mask(d)))
+            except KeyError:
+                undetermined.append(d)
+        if undetermined:
+            logger.info(
+                f"segment {k}: no rank data for {len(undetermined)} values of d"
+            )
+        yield k, with_masks, undetermined
+
+
+def classification_stage(segments, use_LPIP=False):
+    """Keeps those d all of whose large minimally finite values are easy"""
+
+    easy_table = easy_large_vals_table()
+    lpip_hard = lpip_hard_d_values()
+
+    for k, with_masks, undetermined in segments:
+        easy_vals = [
+            d
+            for d, mask in with_masks
+            if easy_table[mask]
+            and d not in lpip_hard
+            and (not use_LPIP or d in LPIP)
+        ]
+        yield k, easy_vals, undetermined
+
+
+def _check_163_segment(d_vals):
+    """Worker for `check_163_stage`"""
+
+    checked = batch_check_mwgp_same_plus(163, d_vals)
+    return [d for d in d_vals if checked[d]]
+
+
+def check_163_stage(segments, num_workers=0, max_in_flight=None):
+    """Keeps those d for which `check_mwgp_same_plus(163, d)` holds.
+
+    With `num_workers` > 0 the segments are checked in a process pool, with
+    at most `max_in_flight` segments (default: twice the number of workers)
+    submitted but not yet yielded. Segments are always yielded in order.
+    """
+
+    if not num_workers:
+        for k, d_vals, undetermined in segments:
+            yield k, _check_163_segment(d_vals), undetermined
+        return
+
+    if max_in_flight is None:
+        max_in_flight = 2 * num_workers
+
+    in_flight = deque()
+
+    with Pool(num_workers) as pool:
+        for k, d_vals, undetermined in segments:
+            result = pool.apply_async(_check_163_segment, (d_vals,))
+            in_flight.append((k, result, undetermined))
+            if len(in_flight) >= max_in_flight:
+                k_done, result, undetermined_done = in_flight.popleft()
+                yield k_done, result.get(), undetermined_done
+
+        while in_flight:
+            k_done, result, undetermined_done = in_flight.popleft()
+            yield k_done, result.get(), undetermined_done
+
+
+def _read_checkpoint(checkpoint_path, params):
+
+    if not os.path.exists(checkpoint_path):
+        return None
+
+    with open(checkpoint_path, "r") as checkpoint_file:
+        checkpoint = json.load(checkpoint_file)
+
+    if checkpoint["params"] != params:
+        raise ValueError(
+            f"{checkpoint_path} belongs to a run with parameters "
+            f"{checkpoint['params']}; remove it to start a new run"
+        )
+
+    return checkpoint
+
+
+def _write_checkpoint(checkpoint_path, checkpoint):
+
+    tmp_path = f"{checkpoint_path}.tmp"
+    with open(tmp_path, "w") as checkpoint_file:
+        json.dump(checkpoint, checkpoint_file)
+        checkpoint_file.flush()
+        os.fsync(checkpoint_file.fileno())
+    os.replace(tmp_path, checkpoint_path)
+
+
+def file_sink(
+    segments,
+    output_path,
+    checkpoint_path,
+    params,
+    next_segment=0,
+    undetermined_path=PIPELINE_UNDETERMINED_PATH,
+):
+    """Appends the convenient values of each segment to `output_path`, in the
+    format of `convenient_values.txt`, and its undetermined values to
+    `undetermined_path`, one per line, and then records the segment as
+    committed. Returns the numbers of convenient and undetermined values
+    written."""
+
+    count = 0
+    undetermined_count = 0
+
+    with open(output_path, "a") as output_file, open(
+        undetermined_path, "a"
+    ) as undetermined_file:
+        for k, convenient_vals, undetermined in segments:
+            for d in convenient_vals:
+                print("d = {} is convenient".format(d))
+                output_file.write(f"{d}: [],\n")
+            for d in undetermined:
+                undetermined_file.write(f"{d}\n")
+            for my_file in (output_file, undetermined_file):
+                my_file.flush()
+                os.fsync(my_file.fileno())
+            count += len(convenient_vals)
+            undetermined_count += len(undetermined)
+            _write_checkpoint(
+                checkpoint_path,
+                {
+                    "params": params,
+                    "next_segment": k + 1,
+                    "output_size": output_file.tell(),
+                    "undetermined_size": undetermined_file.tell(),
+                },
+            )
+            logger.debug(f"committed segment {k}")
+
+    return count, undetermined_count
+
+
+def read_undetermined(undetermined_path=PIPELINE_UNDETERMINED_PATH):
+    """The d recorded as undetermined by a run of `stream_convenient_d`, e.g.
+    to pass to `rank_engine.fill_rank_data` before searching them again"""
+
+    with open(undetermined_path, "r") as undetermined_file:
+        return [int(line) for line in undetermined_file if line.strip()]
+
+
+def stream_convenient_d(
+    d_start,
+    d_end,
+    segment_size=SEGMENT_SIZE,
+    num_workers=0,
+    max_in_flight=None,
+    use_LPIP=False,
+    rank_data=None,
+    output_path=PIPELINE_OUTPUT_PATH,
+    checkpoint_path=PIPELINE_CHECKPOINT_PATH,
+    undetermined_path=PIPELINE_UNDETERMINED_PATH,
+):
+    """Searches d_start <= d < d_end for convenient values of d, in the
+    manner of `search_convenient_d_slow` but using the rank data store
+    (default: `rank_data_dict`) rather than computing ranks. Results are
+    appended to `output_path`, and the d whose rank data is missing or
+    incomplete to `undetermined_path`.
+
+    If `checkpoint_path` records a run of the same range and segment size,
+    both files are cut back to their last committed state and the run
+    continues from the next segment.
+    """
+
+    if rank_data is None:
+        rank_data = rank_data_dict
+
+    params = {
+        "d_start": d_start,
+        "d_end": d_end,
+        "segment_size": segment_size,
+        "use_LPIP": use_LPIP,
+    }
+    checkpoint = _read_checkpoint(checkpoint_path, params)
+
+    if checkpoint is None:
+        next_segment = 0
+        open(output_path, "w").close()
+        open(undetermined_path, "w").close()
+    else:
+        next_segment = checkpoint["next_segment"]
+        # anything after the last commit belongs to an unfinished segment
+        with open(output_path, "a") as output_file:
+            output_file.truncate(checkpoint["output_size"])
+        with open(undetermined_path, "a") as undetermined_file:
+            undetermined_file.truncate(checkpoint.get("undetermined_size", 0))
+        logger.info(f"Resuming from segment {next_segment}")
+
+    segments = squarefree_segments(d_start, d_end, segment_size, next_segment)
+    segments = rank_mask_stage(segments, rank_data)
+    segments = classification_stage(segments, use_LPIP=use_LPIP)
+    segments = check_163_stage(segments, num_workers, max_in_flight)
+
+    count, undetermined_count = file_sink(
+        segments, output_path, checkpoint_path, params, next_segment, undetermined_path
+    )
+    print(f"Found {count} convenient values in this run")
+    if undetermined_count:
+        print(
+            f"{undetermined_count} values of d lack rank data; see "
+            f"{undetermined_path}"
+        )
+    return count
@@ -0,0 +1,223 @@
+"""targeted_isogenies.py
+
+    For j-invariants without CM, `unrecorded_isogenies` only looks at the
+    isogeny degrees which are multiples of z and larger than z. Here we
+    decide whether the isogeny class of E(j) over K has any such degree
+    without constructing the class.
+
+    Over a number field, the isogeny class of a curve E without CM is the
+    product of its l-isogeny graphs, one for each prime l for which E has
+    an l-isogeny, and each of these is a tree. So the degrees in the class
+    are the products of l^e_l with 0 <= e_l <= the diameter of the l-tree,
+    and the class has a degree a with z | a and a > z exactly when, for
+    each l | z, the l-tree has diameter at least the valuation of z at l,
+    and the product of l^diameter is not z itself.
+
+    The primes l are found in three steps:
+
+        - Billerey's bound, via Sage's `possible_isogeny_degrees` with
+          `exact=False`, gives a finite list of primes outside of which E
+          has no l-isogeny;
+        - a trace sieve: if E has an l-isogeny, then for every prime P of
+          good reduction of K with residue field F_p, p != l, the
+          characteristic polynomial x^2 - a_P x + p of Frobenius has a root
+          mod l. A few small split primes rule out most candidates;
+        - only the survivors have their l-isogenies computed, and then the
+          l-tree, one l-isogeny at a time.
+
+    Only the j-invariants for which this finds some wanted degree need
+    their full isogeny class. The first two steps also give the reducible
+    primes which `isogeny_graphs.py` passes to Sage's `isogeny_class`, so
+    that Sage does not work them out again. The split primes used by the
+    sieve depend only on K, so they are kept per field.
+
+    ====================================================================
+
+    This file is part of Quadratic Kenku Solver.
+
+    Copyright (C) 2022 Barinder S. Banwait, Filip Najman, and Oana
+    Padurariu
+
+    Quadratic Kenku Solver is free software: you can redistribute it
+    and/or modify it under the terms of the GNU General Public License
+    as published by the Free Software Foundation, either version 3 of
+    the License, or any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+    ====================================================================
+
+"""
+
+import logging
+from math import prod
+
+from sage.all import EllipticCurve, kronecker_symbol
+from sage.schemes.elliptic_curves.isogeny_class import possible_isogeny_degrees
+
+from deadline_executor import OK, run_jobs
+from level_tables import factorisation
+from sieves import primes_up_to
+
+logger = logging.getLogger(__name__)
+
+# The sieve uses the split primes of good reduction below this bound
+SIEVE_PRIME_BOUND = 200
+# Bigger l-trees are not explored; the class is computed instead
+MAX_TREE_SIZE = 64
+TARGETED_DEADLINE_S = 30
+
+# (discriminant of K, bound) -> the split primes of K below the bound
+_split_primes = {}
+
+
+def frobenius_has_root(a, p, l):
+    """Whether x^2 - a x + p has a root mod the prime l"""
+
+    a, p = a % l, p % l
+    return any((x * x - a * x + p) % l == 0 for x in range(l))
+
+
+def split_primes(K, bound=SIEVE_PRIME_BOUND):
+    """(p, P) for the primes P of K above the primes p < bound split in K"""
+
+    key = (int(K.discriminant()), bound)
+    if key not in _split_primes:
+        D = K.discriminant()
+        _split_primes[key] = [
+            (p, P)
+            for p in primes_up_to(bound - 1)
+            if kronecker_symbol(D, p) == 1
+            for P in K.primes_above(p)
+        ]
+    return _split_primes[key]
+
+
+def frobenius_traces(E, K, bound=SIEVE_PRIME_BOUND):
+    """(p, a_P) for the primes P of K of good reduction for E above the
+    primes p < bound split in K"""
+
+    return [
+        (p, int(E.reduction(P).trace_of_frobenius()))
+        for p, P in split_primes(K, bound)
+        if E.has_good_reduction(P)
+    ]
+
+
+def sieve_isogeny_primes(candidates, traces):
+    """Those l in `candidates` which the traces do not rule out"""
+
+    return [
+        l
+        for l in candidates
+        if all(frobenius_has_root(a, p, l) for p, a in traces if p != l)
+    ]
+
+
+def reducible_primes(E, K):
+    """A list of primes containing all l for which E has an l-isogeny over
+    K: the primes allowed by Billerey's bound which the trace sieve does
+    not rule out"""
+
+    candidates = sorted(int(l) for l in possible_isogeny_degrees(E, exact=False))
+    return sieve_isogeny_primes(candidates, frobenius_traces(E, K))
+
+
+def isogeny_tree_diameter(E, l, max_size=MAX_TREE_SIZE):
+    """The diameter of the tree of l-isogenies through E, or None if the
+    tree has more than `max_size` curves"""
+
+    # curves by j-invariant; without CM, isogenous curves with the same
+    # j-invariant are isomorphic
+    curves = {E.j_invariant(): E}
+    edges = {E.j_invariant(): set()}
+    to_visit = [E]
+
+    while to_visit:
+        F = to_visit.pop()
+        for phi in F.isogenies_prime_degree(l):
+            G = phi.codomain()
+            j_F, j_G = F.j_invariant(), G.j_invariant()
+            if j_G not in curves:
+                if len(curves) == max_size:
+                    return None
+                curves[j_G] = G
+                edges[j_G] = set()
+                to_visit.append(G)
+            edges[j_F].add(j_G)
+            edges[j_G].add(j_F)
+
+    return _tree_diameter(edges)
+
+
+def _tree_diameter(edges):
+    """The diameter of a tree given by its adjacency sets: the distance to
+    the vertex farthest from the vertex farthest from any vertex"""
+
+    def farthest(start):
+        depth = {start: 0}
+        layer = [start]
+        while layer:
+            next_layer = []
+            for v in layer:
+                for w in edges[v]:
+                    if w not in depth:
+                        depth[w] = depth[v] + 1
+                        next_layer.append(w)
+            layer = next_layer
+        v = max(depth, key=depth.get)
+        return v, depth[v]
+
+    end, _ = farthest(next(iter(edges)))
+    return farthest(end)[1]
+
+
+def has_degree_multiple(j, K, z):
+    """Whether the isogeny class of E(j) over K may have a degree a with
+    z | a and a > z. True for j with CM, and whenever in doubt."""
+
+    E = EllipticCurve(j=K(j))
+    if E.has_cm():
+        return True
+
+    z_factors = factorisation(z)
+    survivors = reducible_primes(E, K)
+    if not set(z_factors) <= set(survivors):
+        return False
+
+    diameters = {}
+    for l in survivors:
+        diameter = isogeny_tree_diameter(E, l)
+        if diameter is None:
+            return True
+        diameters[l] = diameter
+
+    if any(diameters[l] < e for l, e in z_factors.items()):
+        return False
+    return prod(l**diameter for l, diameter in diameters.items()) != z
+
+
+def needing_class(K, js, z, num_workers=1, deadline=TARGETED_DEADLINE_S):
+    """Those j in `js` whose isogeny class may have a degree a with z | a
+    and a > z, as a set. Each j is decided in a child process; those not
+    decided in time are kept."""
+
+    # so that the children inherit them
+    split_primes(K)
+    jobs = [(i, has_degree_multiple, (j, K, z)) for i, j in enumerate(js)]
+    needed = set()
+
+    for i, outcome in run_jobs(jobs, num_workers, deadline):
+        if outcome.status != OK:
+            logger.info(f"Targeted search for {js[i]} ended in {outcome.status}")
+            needed.add(js[i])
+        elif outcome.value:
+            needed.add(js[i])
+
+    return needed
@@ -0,0 +1,192 @@
+"""twist_selection.py
+
+    Small models of curves with given j-invariants, for the isogeny class
+    computations of `isogeny_graphs.py`.
+
+    `EllipticCurve(j=K(j))` (and `ellfromj` in PARI) give a model whose
+    coefficients grow with j and whose conductor is divisible by most of
+    the primes of j - 1728, and the isogeny class computations suffer for
+    it. For j other than 0 and 1728 any quadratic twist of that curve does
+    just as well: its isogeny class consists of the twists of the curves
+    of the original class, which have the same j-invariants and the same
+    isogeny degrees. So before any isogeny work, a twist of small
+    conductor is picked, greedily, among the twists by -1, the fundamental
+    unit and the generators of the principal primes of additive reduction,
+    with ties broken by the height of the coefficients, and a global (or
+    semi-global) minimal model of it is taken.
+
+    The conductor exponents of all these twists only change at the primes
+    of bad reduction of the original curve and at the primes above 2, so
+    the conductors are compared there only. Finding the bad primes means
+    factoring the discriminant, so each selection runs with a deadline,
+    and the model from j is used if it takes too long.
+
+    Running this file times the isogeny classes of all the j-invariants in
+    the quadratic points catalogue both ways, and checks that they agree.
+
+    ====================================================================
+
+    This file is part of Quadratic Kenku Solver.
+
+    Copyright (C) 2022 Barinder S. Banwait, Filip Najman, and Oana
+    Padurariu
+
+    Quadratic Kenku Solver is free software: you can redistribute it
+    and/or modify it under the terms of the GNU General Public License
+    as published by the Free Software Foundation, either version 3 of
+    the License, or any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+    ====================================================================
+
+"""
+
+import logging
+import time
+from math import log
+
+from sage.all import EllipticCurve
+
+from deadline_executor import OK, run_jobs
+
+logger = logging.getLogger(__name__)
+
+TWIST_DEADLINE_S = 20
+
+
+def _log_conductor(E, primes):
+    """The logarithm of the norm of the part of the conductor of E at
+    `primes`"""
+
+    return sum(
+        E.local_data(P).conductor_valuation() * log(P.norm()) for P in primes
+    )
+
+
+def _height(E):
+    return max(a.global_height() for a in E.a_invariants())
+
+
+def minimal_model(E):
+    """A global minimal model of E if there is one, else a semi-global one
+    (minimal at all primes but one), both with reduced coefficients"""
+
+    try:
+        return E.global_minimal_model(semi_global=True)
+    except (ArithmeticError, ValueError, NotImplementedError) as err_msg:
+        logger.debug(f"No smaller model of {E}: {err_msg}")
+        return E
+
+
+def twist_parameters(E, K):
+    """The d by which `small_twist` tries to twist E"""
+
+    units = [K(-1)] + [K(u) for u in K.units()]
+    additive_primes = [
+        P
+        for P in K.ideal(E.discriminant()).prime_factors()
+        if E.local_data(P).has_additive_reduction() and P.is_principal()
+    ]
+    return units + [P.gens_reduced()[0] for P in additive_primes]
+
+
+def small_twist(j, K):
+    """A minimal model of a quadratic twist of small conductor of E(j)
+    over K, or of E(j) itself if j is 0 or 1728"""
+
+    E = EllipticCurve(j=K(j))
+    if K(j) in (0, 1728):
+        return minimal_model(E)
+
+    primes = set(K.ideal(E.discriminant()).prime_factors()) | set(K.primes_above(2))
+
+    def size(F):
+        return round(_log_conductor(F, primes), 6), _height(F)
+
+    best, best_size = E, size(E)
+    for D in twist_parameters(E, K):
+        F = best.quadratic_twist(D)
+        F_size = size(F)
+        if F_size < best_size:
+            best, best_size = F, F_size
+
+    return minimal_model(best)
+
+
+def small_models(js, K, num_workers=1, deadline=TWIST_DEADLINE_S):
+    """A small model for each j in `js`, as a list aligned with `js`, each
+    found in a child process; where that fails, the model from j"""
+
+    jobs = [(i, small_twist, (j, K)) for i, j in enumerate(js)]
+    models = [None] * len(js)
+
+    for i, outcome in run_jobs(jobs, num_workers, deadline):
+        if outcome.status == OK:
+            models[i] = outcome.value
+        else:
+            logger.info(f"No small twist for {js[i]} ({outcome.status})")
+            models[i] = EllipticCurve(j=K(js[i]))
+
+    return models
+
+
+def benchmark(num_workers=1):
+    """Times the isogeny classes of the j-invariants in the quadratic points
+    catalogue from E(j) and from the small twists, and checks that the
+    j-invariants and isogeny degrees agree"""
+
+    from sage.all import QuadraticField
+
+    from deadline_executor import run_with_deadline
+    from isogeny_graphs import ISOGENY_CLASS_TIMEOUT_S, _sage_isogeny_class
+    from quadratic_kenku_solver import unique_j_inv_count
+    from utils import qdpts_dat
+
+    def degrees(C):
+        jInvs, M = C
+        return {
+            (j1, j2, M[r][c])
+            for r, j1 in enumerate(jInvs)
+            for c, j2 in enumerate(jInvs)
+        }
+
+    for N, data_this_N in sorted(qdpts_dat.items(), key=lambda x: int(x[0])):
+        for d, j_invs_str in data_this_N["non_cm_points"].items():
+            K = QuadraticField(int(d), "K_gen")
+            _, j_inv_list = unique_j_inv_count(j_invs_str, K.gen())
+
+            for j in j_inv_list:
+                start = time.perf_counter()
+                old = run_with_deadline(
+                    _sage_isogeny_class,
+                    EllipticCurve(j=K(j)),
+                    K,
+                    deadline=ISOGENY_CLASS_TIMEOUT_S,
+                )
+                old_time = time.perf_counter() - start
+
+                start = time.perf_counter()
+                E = small_models([j], K, num_workers)[0]
+                new = run_with_deadline(
+                    _sage_isogeny_class, E, K, deadline=ISOGENY_CLASS_TIMEOUT_S
+                )
+                new_time = time.perf_counter() - start
+
+                if old.status == OK and new.status == OK:
+                    assert degrees(old.value) == degrees(new.value), (N, d, j)
+                print(
+                    f"N = {N:>3}, d = {d:>5}, j = {j}: E(j) {old.status} "
+                    f"{old_time:8.3f}s, small twist {new.status} {new_time:8.3f}s"
+                )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    benchmark()
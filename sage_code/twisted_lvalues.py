@@ -0,0 +1,238 @@
+"""twisted_lvalues.py
+
+    Central values L(E^d, 1) of the quadratic twists of a fixed elliptic
+    curve E/Q for many d at once. These decide whether the twists of the
+    genus one X_0(N) (in the rank data) and of 37b1 (in
+    `process_hyperelliptic`) have rank zero.
+
+    The twist of E by the character chi_D of Q(sqrt(d)) has coefficients
+    chi_D(n) a_n. When D is coprime to the conductor N of E, the twist has
+    conductor N D^2 and root number w(E) chi_D(-N), and for root number +1
+
+        L(E^d, 1) = 2 * sum_n chi_D(n) (a_n / n) exp(-2 pi n / (|D| sqrt(N))).
+
+    So the a_n are computed once per curve, and each d costs a few NumPy
+    gathers (see `character_tables.py`) and one weighted sum. Values too
+    close to zero to be trusted, and the d not coprime to N, are decided
+    exactly instead, by the twisted modular symbol sum at level N (Birch's
+    formula).
+
+    The number of terms grows like |D| sqrt(N), so the series is only used
+    while it needs at most `MAX_SERIES_TERMS` terms; twists with larger |D|
+    go to PARI's `ellanalyticrank` one at a time instead, which keeps the
+    memory bounded over the large d ranges of `rank_engine.py`.
+
+    Both exact fallbacks can take long for large |D|. `rank_zero_twists`
+    runs them inline, which is fine for the few d of the solver;
+    `rank_engine.py` only takes the verdicts of the series in bulk, from
+    `series_verdicts`, and runs `exact_rank_zero` on the rest in child
+    processes with a deadline.
+
+    ====================================================================
+
+    This file is part of Quadratic Kenku Solver.
+
+    Copyright (C) 2022 Barinder S. Banwait, Filip Najman, and Oana
+    Padurariu
+
+    Quadratic Kenku Solver is free software: you can redistribute it
+    and/or modify it under the terms of the GNU General Public License
+    as published by the Free Software Foundation, either version 3 of
+    the License, or any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+    ====================================================================
+
+"""
+
+import logging
+from math import ceil, gcd, log, pi, sqrt
+
+import numpy as np
+from sage.all import QQ, EllipticCurve, kronecker_symbol, pari
+
+from character_tables import kronecker_values
+from utils import GENUS_ONE_LIST
+
+logger = logging.getLogger(__name__)
+
+TWIST_CURVE_LABELS = [str(N) + "a1" for N in GENUS_ONE_LIST] + ["37b1"]
+
+# The series is truncated once the weights drop below this
+SERIES_TOL = 1e-14
+# Central values smaller than this go to the exact fallback
+NEAR_ZERO = 1e-6
+# The most terms of the series computed for one curve; 8 bytes each
+MAX_SERIES_TERMS = 2**22
+
+
+_AN_CACHE = {}
+_CONDUCTOR_CACHE = {}
+
+
+def conductor(label):
+    """The conductor of EllipticCurve(label), computed once per curve"""
+
+    if label not in _CONDUCTOR_CACHE:
+        _CONDUCTOR_CACHE[label] = int(EllipticCurve(label).conductor())
+    return _CONDUCTOR_CACHE[label]
+
+
+def an_over_n(label, length):
+    """float64 array of a_n / n for 0 <= n <= length (the 0-th entry is 0).
+    The a_n are computed once per curve, and only recomputed if a longer
+    list is asked for."""
+
+    if label not in _AN_CACHE or len(_AN_CACHE[label]) <= length:
+        E = EllipticCurve(label)
+        logger.debug(f"Computing {length} coefficients of {label}")
+        a_n = np.array(E.anlist(length), dtype=np.float64)
+        a_n[1:] /= np.arange(1, length + 1, dtype=np.float64)
+        _AN_CACHE[label] = a_n
+
+    return _AN_CACHE[label][: length + 1]
+
+
+def _num_terms(N, D):
+    """How many terms of the series are needed for conductor N D^2"""
+
+    return ceil(abs(D) * sqrt(N) * log(1 / SERIES_TOL) / (2 * pi))
+
+
+def _fundamental_discriminant(d):
+    return d if d % 4 == 1 else 4 * d
+
+
+def fits_series(label, d):
+    """Whether the series for the twist by d has at most `MAX_SERIES_TERMS`
+    terms"""
+
+    D = _fundamental_discriminant(d)
+    return _num_terms(conductor(label), D) <= MAX_SERIES_TERMS
+
+
+def twisted_central_values(label, d_vals):
+    """Dictionary d -> L(E^d, 1) for E = EllipticCurve(label), as a float.
+    Twists of root number -1 get exactly 0.0. The d for which D is not
+    coprime to the conductor of E get None, as the formula above does not
+    apply to them, and so do those needing more than `MAX_SERIES_TERMS`
+    terms."""
+
+    N = conductor(label)
+    w = int(EllipticCurve(label).root_number())
+
+    discs = {d: _fundamental_discriminant(d) for d in d_vals}
+    terms = {d: _num_terms(N, D) for d, D in discs.items()}
+    max_terms = max([t for t in terms.values() if t <= MAX_SERIES_TERMS], default=0)
+    coeffs = an_over_n(label, max_terms)
+    n = np.arange(max_terms + 1, dtype=np.int64)
+
+    output = {}
+
+    for d, D in discs.items():
+        if gcd(D, N) != 1:
+            output[d] = None
+            continue
+        if w * kronecker_symbol(D, -N) == -1:
+            output[d] = 0.0
+            continue
+        num_terms = terms[d]
+        if num_terms > MAX_SERIES_TERMS:
+            output[d] = None
+            continue
+        n_here = n[1 : num_terms + 1]
+        weights = np.exp(-2 * pi * n_here / (abs(D) * sqrt(N)))
+        chi = kronecker_values(d, n_here)
+        output[d] = float(2 * np.dot(coeffs[1 : num_terms + 1] * chi, weights))
+
+    return output
+
+
+def twisted_modular_symbol_sum(label, d):
+    """The exact rational sum over a mod |D| of chi_D(a) [a / |D|], with the
+    modular symbol of sign chi_D(-1). By Birch's formula this is a nonzero
+    multiple of L(E, chi_D, 1), which differs from L(E^d, 1) by finitely
+    many Euler factors, none of which vanish at s = 1. So it is zero iff
+    L(E^d, 1) is."""
+
+    E = EllipticCurve(label)
+    D = _fundamental_discriminant(d)
+    m = abs(D)
+    sign = 1 if D > 0 else -1
+
+    try:
+        ms = E.modular_symbol(sign=sign)
+    except (ValueError, NotImplementedError):
+        ms = E.modular_symbol(sign=sign, implementation="sage")
+
+    return sum(
+        kronecker_symbol(D, a) * ms(QQ((a, m))) for a in range(1, m) if gcd(a, m) == 1
+    )
+
+
+def analytic_rank_is_zero(label, d):
+    """Whether PARI's `ellanalyticrank` finds rank zero for the twist by d
+    of EllipticCurve(label), for the twists too large for the series"""
+
+    twist = EllipticCurve(label).quadratic_twist(d).minimal_model()
+    return int(pari(twist).ellanalyticrank()[0]) == 0
+
+
+def series_verdicts(label, d_vals, near_zero=NEAR_ZERO):
+    """Dictionary d -> whether L(E^d, 1) is nonzero, as far as
+    `twisted_central_values` can tell, for E = EllipticCurve(label): True
+    for values clearly away from zero, False for root number -1, and None
+    for the d left to `exact_rank_zero`"""
+
+    output = {}
+
+    for d, value in twisted_central_values(label, d_vals).items():
+        if value == 0.0:
+            output[d] = False
+        elif value is not None and abs(value) > near_zero:
+            output[d] = True
+        else:
+            output[d] = None
+
+    return output
+
+
+def exact_rank_zero(label, d):
+    """Whether L(E^d, 1) is nonzero for E = EllipticCurve(label), from the
+    exact `twisted_modular_symbol_sum`, or from `analytic_rank_is_zero` for
+    the d too large for the series"""
+
+    if not fits_series(label, d):
+        logger.debug(f"Using ellanalyticrank for {label} at {d}")
+        return analytic_rank_is_zero(label, d)
+
+    logger.debug(f"Using the exact fallback for {label} at {d}")
+    return twisted_modular_symbol_sum(label, d) != 0
+
+
+def rank_zero_twists(label, d_vals, near_zero=NEAR_ZERO):
+    """Dictionary d -> whether L(E^d, 1) is nonzero, i.e. (by Kolyvagin)
+    whether the twist has rank zero, for E = EllipticCurve(label). The bulk
+    of the d are decided by `series_verdicts`, the rest by `exact_rank_zero`
+    in this process."""
+
+    output = series_verdicts(label, d_vals, near_zero)
+
+    for d, verdict in output.items():
+        if verdict is None:
+            output[d] = exact_rank_zero(label, d)
+
+    return output
+
+
+def twist_has_rank_zero(label, d):
+    """Whether the twist by d of EllipticCurve(label) has analytic rank zero"""
+
+    return rank_zero_twists(label, [d])[d]
@@ -28,17 +28,10 @@ Some helpful functions.
 
 from sage.all import (
     Integer,
-    Gamma0,
     ZZ,
     gcd,
-    prod,
-    kronecker_symbol,
     prime_range,
-    kronecker_character,
-    ModularSymbols,
-    parent,
     EllipticCurve,
-    companion_matrix,
     oo,
 )
 
@@ -69,24 +62,49 @@ HYPERELLIPTIC_VALUES = {
 }
 
 import json
-from hyperelliptic_verifs import try_trbovic_filter
+import os
+from multiprocessing import Pool
+from filter_pipeline import format_stats, run_filter_pipeline
+from hyperelliptic_verifs import batch_try_trbovic_filter, try_trbovic_filter
 from non_hyperelliptic_verifs import (
     is_rank_of_twist_zero_minus,
     try_oezman_sieve,
     check_mwgp_same_minus,
 )
 from large_possible_isogeny_primes import LPIP
+from level_tables import (
+    ELLIPTIC,
+    HYPERELLIPTIC,
+    classify_level,
+    fixed_point_number,
+    genus_of_quotient,
+    is_atkin_lehner_divisor,
+    nonsplit_cartan_genus,
+    split_cartan_genus,
+)
+from modsym_cache import sign_part
+from mwgp_batch import PLUS, batch_check_mwgp_same, frobenius_point_counts
+from rank_data_store import RankDataStore
 
 QUADRATIC_POINTS_DATA_PATH = "quadratic_points_catalogue.json"
+RANK_DATA_TEXT_PATH = "../magma_code/RankData.txt"
+RANK_DATA_PATH = "../magma_code/RankData.bin"
+# The ranks filled in by `rank_engine.py`, which the binary store is rebuilt with
+RANK_DATA_OVERLAY_PATH = "../magma_code/RankData.engine.jsonl"
+CONVENIENT_VALUES_PATH = "convenient_values.txt"
+CONVENIENT_JOURNAL_PATH = "convenient_values.journal"
 
 with open(QUADRATIC_POINTS_DATA_PATH, "r") as qdpts_dat_file:
     qdpts_dat = json.load(qdpts_dat_file)
 
-with open("../magma_code/RankData.txt", "r") as the_file:
-    rank_data = the_file.read().splitlines()
-
-A = [a_line.split(":") for a_line in rank_data]
-rank_data_dict = {Integer(d): eval(my_list) for d, my_list in A}
+# The rank data is read lazily from a memory-mapped binary store, built from
+# the text file the first time it is needed; see `rank_data_store.py`
+rank_data_dict = RankDataStore(
+    RANK_DATA_PATH,
+    text_path=RANK_DATA_TEXT_PATH,
+    levels=GENUS_ONE_LIST,
+    overlay_path=RANK_DATA_OVERLAY_PATH,
+)
 
 
 def get_easy_large_vals():
@@ -106,114 +124,6 @@ def get_easy_large_vals():
 EASY_LARGE_VALS = get_easy_large_vals()
 
 
-def split_cartan_genus(p):
-    """Computes the genus of X_s(p) from Imin Chen's "The Jacobians of
-    non-split Cartan modular curves"""
-
-    return (1 / 24) * (p ^ 2 - 8 * p + 11 - 4 * kronecker_symbol(-3, p))
-
-
-def nonsplit_cartan_genus(p):
-    """Computes the genus of X_ns(p) from Imin Chen's "The Jacobians of
-    non-split Cartan modular curves"""
-
-    return (1 / 24) * (
-        p ^ 2 - 10 * p + 23 + 6 * kronecker_symbol(-1, p) + 4 * kronecker_symbol(-3, p)
-    )
-
-
-def is_atkin_lehner_divisor(d, N):
-
-    if ZZ(d).divides(N):
-        if gcd(d, N / d) == 1:
-            return True
-    return False
-
-
-def c_i_at_2(i, Ndash, N):
-
-    if i == 1:
-        if Ndash % 4 == 1:
-            if is_atkin_lehner_divisor(2, N):
-                return 1
-            elif ZZ(4).divides(N):
-                return 0
-        if Ndash % 4 == 3:
-            if is_atkin_lehner_divisor(2, N):
-                return 2
-            elif ZZ(4).divides(N):
-                return 3 + kronecker_symbol(-Ndash, 2)
-            elif ZZ(8).divides(N):
-                return 3 * (1 + kronecker_symbol(-Ndash, 2))
-
-    if i == 2 and Ndash % 4 == 3:
-        return 1 + kronecker_symbol(-Ndash, 2)
-
-
-def c_i(i, p, Ndash, N):
-
-    if p == 2:
-        return c_i_at_2(i, Ndash, N)
-
-    if Ndash % 4 == 3:
-        return 1 + kronecker_symbol(-Ndash, p)
-
-    else:
-        return 1 + kronecker_symbol(-4 * Ndash, p)
-
-
-def fixed_point_number(Ndash, N):
-
-    assert is_atkin_lehner_divisor(Ndash, N), "Ndash does not give an AL involution"
-
-    N_over_Ndash = ZZ(N / Ndash)
-
-    base_contribution = (
-        prod([c_i(1, p, Ndash, N) for p in N_over_Ndash.prime_divisors()])
-        * ZZ(-4 * Ndash).class_number()
-    )
-
-    if Ndash == 2:
-        other_contribution = prod(
-            [1 + kronecker_symbol(-4, p) for p in ZZ(N / 2).prime_divisors()]
-        )
-    elif Ndash == 3:
-        other_contribution = prod(
-            [1 + kronecker_symbol(-3, p) for p in ZZ(N / 3).prime_divisors()]
-        )
-    elif Ndash == 4:
-        all_divisors_N_over_4 = (ZZ(N / 4)).divisors()
-        all_AL_divisors = [
-            D for D in all_divisors_N_over_4 if is_atkin_lehner_divisor(D, (ZZ(N / 4)))
-        ]
-        pre_prime_power_divisor_data = [
-            D.is_prime_power(get_data=True) for D in all_AL_divisors
-        ]
-        prime_power_divisor_data = [
-            (p, nu) for p, nu in pre_prime_power_divisor_data if nu != 0
-        ]
-        other_contribution = prod(
-            [
-                p ** (nu // 2) + p ** ((nu - 1) // 2)
-                for p, nu in prime_power_divisor_data
-            ]
-        )
-    elif Ndash % 4 == 3:
-        other_contribution = (
-            prod([c_i(2, p, Ndash, N) for p in N_over_Ndash.prime_divisors()])
-            * ZZ(-Ndash).class_number()
-        )
-    else:
-        other_contribution = 0
-
-    return base_contribution + other_contribution
-
-
-def genus_of_quotient(N, Ndash):
-
-    return (1 / 4) * (2 * Gamma0(N).genus() + 2 - fixed_point_number(Ndash, N))
-
-
 # Some testing of the function, the following examples taken from Galbraith's thesis
 
 assert genus_of_quotient(91, 91) == 2
@@ -223,6 +133,12 @@ assert genus_of_quotient(84, 84) == 4
 assert genus_of_quotient(92, 23) == 1
 assert genus_of_quotient(99, 99) == 3
 
+# and the hyperelliptic X_0(N) found from the tables are those listed by Ogg
+
+assert {N for N in range(1, 100) if classify_level(N) == HYPERELLIPTIC} == (
+    HYPERELLIPTIC_VALUES
+)
+
 
 def is_multiple_of(x, a_set):
 
@@ -311,11 +227,110 @@ def _minimally_finite_fast(genus_one_zero_rank_list):
     return output
 
 
+def rank_zero_mask(genus_one_zero_rank_list):
+    """Encodes a subset of GENUS_ONE_LIST as a 12-bit integer, with bit i
+    set iff GENUS_ONE_LIST[i] is in the subset"""
+
+    return sum(
+        1 << i for i, N in enumerate(GENUS_ONE_LIST) if N in genus_one_zero_rank_list
+    )
+
+
+def rank_zero_list_from_mask(mask):
+    """Inverse of `rank_zero_mask`"""
+
+    return [Integer(N) for i, N in enumerate(GENUS_ONE_LIST) if (mask >> i) & 1]
+
+
+_MINIMALLY_FINITE_TABLE = None
+_EASY_LARGE_VALS_TABLE = None
+
+
+def minimally_finite_table():
+    """The output of `_minimally_finite_fast` depends only on which of the
+    12 genus one curves have rank zero, so there are only 4096 possible
+    outputs. This returns all of them, indexed by `rank_zero_mask`. It is
+    built on first use and then kept for the lifetime of the process."""
+
+    global _MINIMALLY_FINITE_TABLE
+
+    if _MINIMALLY_FINITE_TABLE is None:
+        _MINIMALLY_FINITE_TABLE = [
+            tuple(_minimally_finite_fast(rank_zero_list_from_mask(mask)))
+            for mask in range(1 << len(GENUS_ONE_LIST))
+        ]
+
+    return _MINIMALLY_FINITE_TABLE
+
+
+def easy_large_vals_table():
+    """For each of the 4096 rank-zero masks, whether all of the minimally
+    finite values larger than 100 are in EASY_LARGE_VALS"""
+
+    global _EASY_LARGE_VALS_TABLE
+
+    if _EASY_LARGE_VALS_TABLE is None:
+        _EASY_LARGE_VALS_TABLE = [
+            all(x in EASY_LARGE_VALS for x in mf_vals if x > 100)
+            for mf_vals in minimally_finite_table()
+        ]
+
+    return _EASY_LARGE_VALS_TABLE
+
+
+def lpip_hard_d_values():
+    """The d for which LPIP contains a value larger than 100 that is not in
+    EASY_LARGE_VALS; these are never convenient"""
+
+    return {
+        d
+        for d, vals in LPIP.items()
+        if any(x > 100 and x not in EASY_LARGE_VALS for x in vals)
+    }
+
+
+def classify_convenient_candidates(rank_data=None, use_LPIP=False):
+    """Runs the screening step of `search_convenient_d` on every d of
+    `rank_data` (default: all of `rank_data_dict`) in one pass, by table
+    lookup. Returns a dictionary d -> whether all of the large minimally
+    finite values at d, including those from LPIP, are in EASY_LARGE_VALS.
+
+    If `use_LPIP` is set, only d values with large possible isogeny prime
+    data are classified.
+    """
+
+    if rank_data is None:
+        rank_data = rank_data_dict
+
+    easy_table = easy_large_vals_table()
+    lpip_hard = lpip_hard_d_values()
+
+    if isinstance(rank_data, RankDataStore):
+        # the store already holds the masks, in the same bit order. A d with
+        # any undetermined rank is not a candidate until that is filled in
+        status_items = rank_data.status_items()
+    else:
+        status_items = ((d, rank_zero_mask(v), 0) for d, v in rank_data.items())
+
+    return {
+        d: easy_table[mask] and not undetermined and d not in lpip_hard
+        for d, mask, undetermined in status_items
+        if not use_LPIP or d in LPIP
+    }
+
+
 def minimally_finite_fast(d, process=False):
 
-    genus_one_zero_rank_list = rank_data_dict[d]
-    genus_one_zero_rank_list = [Integer(x) for x in genus_one_zero_rank_list]
-    mf_list = _minimally_finite_fast(genus_one_zero_rank_list)
+    if rank_data_dict.undetermined_mask(d):
+        undetermined = rank_data_dict.levels_from_mask(
+            rank_data_dict.undetermined_mask(d)
+        )
+        raise ValueError(
+            f"rank data at {d} is undetermined for N in {undetermined}; "
+            "try rerunning `rank_engine.fill_rank_data` with a longer deadline"
+        )
+
+    mf_list = list(minimally_finite_table()[rank_data_dict.mask(d)])
     if not process:
         return mf_list
 
@@ -324,9 +339,9 @@ def minimally_finite_fast(d, process=False):
     my_non_hyperelliptic_vals = []
 
     for d in mf_list:
-        if d in GENUS_ONE_LIST:
+        if classify_level(d) == ELLIPTIC:
             my_elliptic_vals.append(d)
-        elif d in HYPERELLIPTIC_VALUES:
+        elif classify_level(d) == HYPERELLIPTIC:
             my_hyperelliptic_vals.append(d)
         else:
             my_non_hyperelliptic_vals.append(d)
@@ -338,31 +353,18 @@ def minimally_finite_fast(d, process=False):
 
 def is_torsion_same_plus(p, chi, B=100, uniform=False):
     """Returns true if the plus part of J0(p) does not gain new torsion when
-    base changing to K"""
-    M = ModularSymbols(p)
-    S = M.cuspidal_subspace()
-    T = S.atkin_lehner_operator()
-    S_min = (T - parent(T)(1)).kernel()
-    J0_min = S_min.abelian_variety()
-
-    d = 2
+    base changing to K. The point counts are computed once per level, see
+    `mwgp_batch.py`."""
+    primes, counts_over_q, counts_over_q_sq = frobenius_point_counts(p, PLUS, B)
 
     if uniform:
-        frob_poly_data = [(q, d) for q in prime_range(d + 2, B) if q != p]
+        point_counts = list(counts_over_q_sq)
     else:
-        frob_poly_data = [
-            (q, 1) if chi(q) == 1 else (q, d)
-            for q in prime_range(d + 2, B)
-            if gcd(q, p) == 1
+        point_counts = [
+            n_1 if chi(q) == 1 else n_2
+            for q, n_1, n_2 in zip(primes, counts_over_q, counts_over_q_sq)
         ]
 
-    point_counts = []
-
-    for q, i in frob_poly_data:
-        frob_pol_q = J0_min.frobenius_polynomial(q)
-        frob_mat = companion_matrix(frob_pol_q)
-        point_counts.append((frob_mat**i).charpoly()(1))
-
     # Recall that the rational torsion on J0(p) is entirely contained in
     # the minus part (theorem of Mazur), so checking no-growth of torsion
     # in plus part is done simply as follows
@@ -373,12 +375,10 @@ def is_torsion_same_plus(p, chi, B=100, uniform=False):
 def is_rank_of_twist_zero_plus(p, chi):
     """Returns true if the rank of the twist of the plus part of J_0(p)
     by the character chi is zero"""
-    ML = ModularSymbols(p, base_ring=chi.base_ring())
-    SL = ML.cuspidal_subspace()
-    TL = SL.atkin_lehner_operator()
-    S_min_L = (TL - parent(TL)(1)).kernel()
+    spaces = sign_part(p, 1, chi.base_ring())
+    ML = spaces["ambient"]
 
-    for S in S_min_L.decomposition():
+    for S in spaces["decomposition"]:
         my_map = S.rational_period_mapping()
         w = ML([0, oo])
         wmap = my_map(w)
@@ -393,12 +393,15 @@ def is_rank_of_twist_zero_plus(p, chi):
 
 
 def check_mwgp_same_plus(p, d):
-    """Checks conditions (1) and (2) of Proposition 4.1"""
-    chi = kronecker_character(d)
-    if is_rank_of_twist_zero_plus(p, chi):
-        if is_torsion_same_plus(p, chi):
-            return True
-    return False
+    """Checks conditions (1) and (2) of Proposition 4.1. Everything not
+    depending on d is computed once per level, see `mwgp_batch.py`; the
+    functions above are the direct versions."""
+    return batch_check_mwgp_same(p, [d], PLUS)[d]
+
+
+def batch_check_mwgp_same_plus(p, d_vals):
+    """Dictionary d -> `check_mwgp_same_plus(p, d)` for each d in `d_vals`"""
+    return batch_check_mwgp_same(p, d_vals, PLUS)
 
 
 def search_convenient_d_slow(d_start, d_end):
@@ -436,28 +439,17 @@ def search_convenient_d(use_LPIP=False):
     """
     convenient_count = 0
 
-    if use_LPIP:
-        rank_data_dict_filt = {
-            k: rank_data_dict[k] for k in rank_data_dict if k in LPIP
-        }
-    else:
-        rank_data_dict_filt = rank_data_dict
-
-    with open("convenient_values.txt", "w") as output_file:
-
-        for d, pre_rank_zero_list in rank_data_dict_filt.items():
-
-            rank_zero_list = [Integer(x) for x in pre_rank_zero_list]
-            ans = _minimally_finite_fast(rank_zero_list)
-            if d in LPIP:
-                # if we have info on large possible isogeny primes, add that in.
-                # Users wanting to run this for other ranges should populate
-                # that list, or directly plumb in the isogeny_primes package
-                # here. We have not done this to avoid adding a dependency.
-                ans += LPIP[d]
-            large_vals = [d for d in ans if d > 100]
-            if set(large_vals).issubset(EASY_LARGE_VALS):
-                if check_mwgp_same_plus(163, d):
+    candidates = classify_convenient_candidates(use_LPIP=use_LPIP)
+    checked_at_163 = batch_check_mwgp_same_plus(
+        163, [d for d, is_candidate in candidates.items() if is_candidate]
+    )
+
+    with open(CONVENIENT_VALUES_PATH, "w") as output_file:
+
+        for d, is_candidate in candidates.items():
+
+            if is_candidate:
+                if checked_at_163[d]:
                     print("d = {} is convenient".format(d))
                     # The following runs some automated checks to identify
                     # the hard values one will need to consider
@@ -469,7 +461,135 @@ def search_convenient_d(use_LPIP=False):
     print(f"Total number of convenient is {convenient_count}")
 
 
-def very_convenient_vals():
+def read_convenient_journal(journal_path=CONVENIENT_JOURNAL_PATH):
+    """Reads the journal written by `search_convenient_d_parallel` into a
+    dictionary d -> whether `check_mwgp_same_plus(163, d)` holds"""
+
+    journal = {}
+
+    if not os.path.exists(journal_path):
+        return journal
+
+    with open(journal_path, "r") as journal_file:
+        for a_line in journal_file:
+            try:
+                d, verdict = a_line.split(":")
+                journal[Integer(d.strip())] = bool(int(verdict))
+            except (TypeError, ValueError):
+                # a crash in the middle of a write can leave a truncated
+                # final line; that d simply gets recomputed
+                continue
+
+    return journal
+
+
+def _check_convenient_d(d):
+    """Worker for `search_convenient_d_parallel`"""
+
+    return d, check_mwgp_same_plus(163, d)
+
+
+def search_convenient_d_parallel(
+    num_workers=None, use_LPIP=False, shard_size=1, journal_path=CONVENIENT_JOURNAL_PATH
+):
+    """Parallel and resumable version of `search_convenient_d`.
+
+    The cheap screening is done here; the d values surviving it are sent in
+    shards of `shard_size` to a pool of `num_workers` processes (default: one
+    per core) for the check at 163. Every finished d is appended to the journal
+    at `journal_path` as soon as it comes back, and journaled d values are not
+    recomputed, so an interrupted run may simply be restarted. The verdict at
+    163 does not depend on `use_LPIP`, so the same journal serves both modes.
+
+    The output file is written at the end, in increasing order of d, and
+    agrees with the one written by `search_convenient_d`.
+    """
+
+    journal = read_convenient_journal(journal_path)
+
+    candidates = [
+        d
+        for d, is_candidate in classify_convenient_candidates(use_LPIP=use_LPIP).items()
+        if is_candidate
+    ]
+    pending = [d for d in candidates if d not in journal]
+    print(f"{len(candidates) - len(pending)} d values already journaled, "
+          f"{len(pending)} to go")
+
+    if pending:
+        with open(journal_path, "a") as journal_file, Pool(num_workers) as pool:
+            for d, verdict in pool.imap_unordered(
+                _check_convenient_d, pending, chunksize=shard_size
+            ):
+                journal_file.write(f"{d}: {int(verdict)}\n")
+                journal_file.flush()
+                os.fsync(journal_file.fileno())
+                journal[d] = verdict
+                if verdict:
+                    print("d = {} is convenient".format(d))
+
+    convenient_vals = sorted(d for d in candidates if journal[d])
+
+    with open(CONVENIENT_VALUES_PATH, "w") as output_file:
+        for d in convenient_vals:
+            output_file.write(f"{d}: [],\n")
+
+    print(f"Total number of convenient is {len(convenient_vals)}")
+    return convenient_vals
+
+
+def _quadratic_points_complete(d, z):
+    return qdpts_dat[str(z)]["is_complete"]
+
+
+def _trbovic_removes(d, z):
+    return not try_trbovic_filter(d, z)
+
+
+def _oezman_removes(d, z):
+    return not try_oezman_sieve(d, z)
+
+
+def _mwgp_same_minus(d, z):
+    return check_mwgp_same_minus(z, d)
+
+
+def _mwgp_same_plus(d, z):
+    return check_mwgp_same_plus(z, d)
+
+
+HARD_VALUE_CHECKS = {
+    "complete": _quadratic_points_complete,
+    "trbovic": _trbovic_removes,
+    "oezman": _oezman_removes,
+    "mwgp_minus": _mwgp_same_minus,
+    "mwgp_plus": _mwgp_same_plus,
+}
+
+# Rough costs in seconds, until the pipeline has measured its own
+HARD_VALUE_CHECK_PRIORS = {
+    "complete": 1e-6,
+    "trbovic": 1e-3,
+    "oezman": 1e-2,
+    "mwgp_minus": 10.0,
+    "mwgp_plus": 10.0,
+}
+
+
+def hard_value_removers(z):
+    """The ways of removing the hard value z, as conjunctions of the checks
+    in HARD_VALUE_CHECKS; z is removed if any one of them holds"""
+    if classify_level(z) == HYPERELLIPTIC:
+        if z != 37:
+            return [("trbovic",), ("oezman",)]
+        # 37 requires special handling
+        return [("mwgp_minus",), ("mwgp_plus", "oezman")]
+    if str(z) in qdpts_dat:
+        return [("complete",), ("oezman",), ("mwgp_minus",)]
+    return [("mwgp_minus",), ("mwgp_plus", "oezman")]
+
+
+def very_convenient_vals(num_workers=None):
     """This function finds the values we can actually solve
     out of the 271 convenient values, and determines the list of 32
     d values given in the statement of Theorem 1.2 in the Introduction.
@@ -478,35 +598,43 @@ def very_convenient_vals():
     and its dependent functions. That function is more heavily documented
     so readers may wish to consult it if they do not follow a particular line
     here.
+
+    The checks on the hard values are run by `filter_pipeline.py`, over
+    `num_workers` processes (default: one per core; 0 for none), cheapest
+    first, and stopping at the first hard value which survives them all.
     """
     really_convenient = []
 
     # First get the convenient values
 
-    with open("convenient_values.txt", "r") as the_file:
+    with open(CONVENIENT_VALUES_PATH, "r") as the_file:
         convenient_vals_dump = the_file.read().splitlines()
 
     convenient_vals = [Integer(a_line.split(":")[0]) for a_line in convenient_vals_dump]
 
     # We then proceed only with the data for these convenient values
     rank_data_dict_filt = {k: rank_data_dict[k] for k in convenient_vals}
+    candidates = classify_convenient_candidates(rank_data_dict_filt)
+    checked_at_163 = batch_check_mwgp_same_plus(
+        163, [d for d in rank_data_dict_filt if candidates[d]]
+    )
 
     # We now go through these values and look for the very convenient ones
     # for which we can solve quadratic Kenku
 
+    tasks = []
+
     for d, pre_rank_zero_list in rank_data_dict_filt.items():
-        print(f"Checking if {d} is really convenient ...")
         rank_zero_list = [Integer(x) for x in pre_rank_zero_list]
-        ans = _minimally_finite_fast(rank_zero_list)
+        ans = list(minimally_finite_table()[rank_zero_mask(rank_zero_list)])
         if d in LPIP:
             # if we have info on large possible isogeny primes, add that in.
             # Users wanting to run this for other ranges should populate
             # that list, or directly plumb in the isogeny_primes package
             # here. We have not done this to avoid adding a dependency.
             ans += LPIP[d]
-        large_vals = [d for d in ans if d > 100]
-        if set(large_vals).issubset(EASY_LARGE_VALS):
-            if check_mwgp_same_plus(163, d):
+        if candidates[d]:
+            if checked_at_163[d]:
 
                 # The following runs some automated checks to identify
                 # the hard values one will need to consider
@@ -518,40 +646,33 @@ def very_convenient_vals():
 
                 hard_vals.remove(91)  # all quad pts determined
 
-                vals_to_remove = []
-
-                for z in hard_vals:
-                    if z in HYPERELLIPTIC_VALUES:
-                        if z != 37:
-                            if not try_trbovic_filter(d, z):
-                                vals_to_remove.append(z)
-                            elif not try_oezman_sieve(d, z):
-                                vals_to_remove.append(z)
-                        else:
-                            # 37 requires special handling
-                            if check_mwgp_same_minus(37, d):
-                                vals_to_remove.append(z)
-                            elif check_mwgp_same_plus(37, d):
-                                if not try_oezman_sieve(d, 37):
-                                    vals_to_remove.append(z)
-                    else:
-                        if str(z) in qdpts_dat:
-                            data_this_z = qdpts_dat[str(z)]
-                            if data_this_z["is_complete"]:
-                                vals_to_remove.append(z)
-                            elif not try_oezman_sieve(d, z):
-                                vals_to_remove.append(z)
-                            elif check_mwgp_same_minus(z, d):
-                                vals_to_remove.append(z)
-                        else:
-                            if check_mwgp_same_minus(z, d):
-                                vals_to_remove.append(z)
-                            elif check_mwgp_same_plus(z, d):
-                                if not try_oezman_sieve(d, z):
-                                    vals_to_remove.append(z)
-
-                hard_vals = [x for x in hard_vals if not x in vals_to_remove]
-                if not hard_vals:
-                    really_convenient.append(d)
-                    print(f"{d} is really convenient!")
+                tasks.append((d, hard_vals))
+
+    # The Trbovic filter alone removes a hyperelliptic z other than 37, so
+    # it is run first for all (d, z) at once, and only the rest go through
+    # the pipeline
+    trbovic_levels = sorted(N for N in HYPERELLIPTIC_VALUES if N != 37)
+    trbovic_passes = batch_try_trbovic_filter([d for d, _ in tasks], trbovic_levels)
+    tasks = [
+        (
+            d,
+            [
+                (z, hard_value_removers(z))
+                for z in hard_vals
+                if trbovic_passes.get((d, z), True)
+            ],
+        )
+        for d, hard_vals in tasks
+    ]
+
+    survivors, stats = run_filter_pipeline(
+        tasks, HARD_VALUE_CHECKS, HARD_VALUE_CHECK_PRIORS, num_workers
+    )
+
+    for d, _ in tasks:
+        if survivors[d] is None:
+            really_convenient.append(d)
+            print(f"{d} is really convenient!")
+
+    print(format_stats(stats))
     return really_convenient
@@ -0,0 +1,123 @@
+"""verdict_store.py
+
+    A persistent record of the verdicts of `check_mwgp_same_plus` and
+    `check_mwgp_same_minus`, i.e. of whether the Mordell-Weil group of
+    J_0(p)^+ or J_0(p)^- grows from Q to Q(sqrt(d)), keyed by (p, d, sign),
+    together with how long each verdict took. The search for convenient d,
+    `very_convenient_vals` and the solver all ask the same questions, so
+    each of them is only ever answered once.
+
+    The store is an SQLite database in WAL mode, so any number of processes
+    may read it while one writes, and writers wait for each other rather
+    than fail. Each process opens its own connection.
+
+    ====================================================================
+
+    This file is part of Quadratic Kenku Solver.
+
+    Copyright (C) 2022 Barinder S. Banwait, Filip Najman, and Oana
+    Padurariu
+
+    Quadratic Kenku Solver is free software: you can redistribute it
+    and/or modify it under the terms of the GNU General Public License
+    as published by the Free Software Foundation, either version 3 of
+    the License, or any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+    ====================================================================
+
+"""
+
+import os
+import sqlite3
+import time
+
+VERDICT_STORE_PATH = "mwgp_verdicts.sqlite"
+# How long a writer waits for another one before giving up, in seconds
+LOCK_TIMEOUT_S = 120
+# SQLite limits the number of parameters in a single statement
+QUERY_CHUNK = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS mwgp_verdicts (
+    p INTEGER NOT NULL,
+    d INTEGER NOT NULL,
+    sign INTEGER NOT NULL,
+    verdict INTEGER NOT NULL,
+    seconds REAL NOT NULL,
+    computed_at REAL NOT NULL,
+    PRIMARY KEY (p, d, sign)
+)
+"""
+
+
+class VerdictStore:
+    """The verdicts of the Mordell-Weil checks, stored at `path`"""
+
+    def __init__(self, path=VERDICT_STORE_PATH):
+        self.path = path
+        self._conn = None
+        self._pid = None
+
+    def _connection(self):
+        # a connection must not cross a fork, so worker processes open their own
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.path, timeout=LOCK_TIMEOUT_S)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            with self._conn:
+                self._conn.execute(SCHEMA)
+            self._pid = os.getpid()
+        return self._conn
+
+    def lookup(self, p, d_vals, sign):
+        """Dictionary d -> stored verdict, for those d in `d_vals` which have
+        one at (p, sign)"""
+
+        conn = self._connection()
+        d_vals = [int(d) for d in d_vals]
+        output = {}
+
+        for i in range(0, len(d_vals), QUERY_CHUNK):
+            chunk = d_vals[i : i + QUERY_CHUNK]
+            rows = conn.execute(
+                "SELECT d, verdict FROM mwgp_verdicts WHERE p = ? AND sign = ? "
+                f"AND d IN ({', '.join('?' * len(chunk))})",
+                [int(p), int(sign)] + chunk,
+            )
+            output.update((d, bool(verdict)) for d, verdict in rows)
+
+        return output
+
+    def record(self, p, sign, verdicts, seconds):
+        """Stores a dictionary d -> verdict at (p, sign). `seconds` is the
+        time spent on each d; for a batch, the time per d of the batch."""
+
+        now = time.time()
+        conn = self._connection()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO mwgp_verdicts VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (int(p), int(d), int(sign), int(verdict), seconds, now)
+                    for d, verdict in verdicts.items()
+                ],
+            )
+
+    def timings(self):
+        """Dictionary (p, sign) -> (number of verdicts, mean seconds)"""
+
+        rows = self._connection().execute(
+            "SELECT p, sign, COUNT(*), AVG(seconds) FROM mwgp_verdicts GROUP BY p, sign"
+        )
+        return {(p, sign): (count, mean) for p, sign, count, mean in rows}
+
+
+verdict_store = VerdictStore()